@@ -0,0 +1,358 @@
+# Third-party module imports
+import numpy as np
+
+# Processor types of the C3D files
+INTEL = 84
+DEC = 85
+MIPS = 86
+
+BLOCK_SIZE = 512
+
+
+class C3DChannel:
+    """Analog or point channel of a C3D acquisition, which exposes its values as btk does."""
+
+    def __init__(self, label, values):
+        self.label = label
+        self.values = values
+
+    def GetLabel(self):
+        return self.label
+
+    def GetValues(self):
+        return self.values
+
+
+class C3DAcquisition:
+    """
+    Class used to read the c3d acquisition files using numpy only, without the compiled biomechanical toolkit.
+
+    The file is memory mapped: only the header and the parameter section are parsed when the acquisition is created, and
+    the analog and point channels are strided views of the data section which are only read when they are accessed. The
+    views are returned as is when no scaling is needed, otherwise only the requested channels are scaled.
+
+    The methods used by the acquisition file reader follow the biomechanical toolkit acquisition interface
+    (GetAnalog, GetPoint, GetAnalogFrequency, GetPointFrequency, ...) so that both can be used interchangeably.
+
+    Notes
+    -----
+    C3D format documentation: https://www.c3d.org/HTML/default.htm
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.buffer = np.memmap(filepath, dtype=np.uint8, mode="r")
+
+        if self.buffer.size < BLOCK_SIZE:
+            raise RuntimeError("Truncated c3d file header: {}".format(filepath))
+
+        parameter_block = int(self.buffer[0])
+        parameter_start = (parameter_block - 1) * BLOCK_SIZE
+        if parameter_block < 1 or parameter_start + 4 > self.buffer.size:
+            raise RuntimeError("Invalid c3d parameter section: {}".format(filepath))
+
+        self.processor = int(self.buffer[parameter_start + 3])
+        self.endianness = ">" if self.processor == MIPS else "<"
+
+        self.header = self.parse_header()
+        self.parameters = self.parse_parameters(parameter_start)
+
+        self.point_used = int(self.get_parameter("POINT", "USED", self.header["point_count"]))
+        self.point_scale = float(self.get_parameter("POINT", "SCALE", self.header["scale_factor"]))
+        self.point_rate = float(self.get_parameter("POINT", "RATE", self.header["frame_rate"]))
+        self.analog_used = int(self.get_parameter("ANALOG", "USED", 0))
+        self.analog_per_frame = self.compute_analog_per_frame()
+        self.analog_rate = float(self.get_parameter("ANALOG", "RATE", self.point_rate * self.analog_per_frame))
+
+        self.is_float = self.point_scale < 0
+        self.analog_unsigned = str(self.get_parameter("ANALOG", "FORMAT", "")).strip().upper() == "UNSIGNED"
+
+        self.point_labels = self.get_labels("POINT", self.point_used)
+        self.analog_labels = self.get_labels("ANALOG", self.analog_used)
+
+        self.data_offset = (int(self.get_parameter("POINT", "DATA_START", self.header["data_block"])) - 1) * BLOCK_SIZE
+        self.frame_dtype = self.create_frame_dtype()
+        self.expected_frames = self.compute_expected_frame_number()
+        self.frames = self.compute_frame_number()
+        if self.frames > 0:
+            self.data = np.ndarray(shape=(self.frames,), dtype=self.frame_dtype, buffer=self.buffer,
+                                   offset=self.data_offset)
+        else:
+            self.data = np.zeros((0,), dtype=self.frame_dtype)
+
+    def parse_header(self):
+        """Parse the header block of the c3d file."""
+
+        words = self.buffer[:24].view(self.endianness + "u2")
+
+        return {"point_count": int(words[1]),
+                "analog_count": int(words[2]),
+                "first_frame": int(words[3]),
+                "last_frame": int(words[4]),
+                "scale_factor": float(self.decode_floats(self.buffer[12:16])[0]),
+                "data_block": int(words[8]),
+                "analog_per_frame": int(words[9]),
+                "frame_rate": float(self.decode_floats(self.buffer[20:24])[0])}
+
+    def parse_parameters(self, parameter_start):
+        """
+        Parse the parameter section of the c3d file.
+
+        Returns a dictionary of the parameters values of each group, indexed by group and parameter names.
+        """
+
+        group_names = {}
+        group_parameters = {}
+        position = parameter_start + 4
+
+        while position + 2 <= self.buffer.size:
+            name_length, group_id = (int(value) for value in self.buffer[position:position + 2].view(np.int8))
+            if name_length == 0:
+                break
+
+            name_start = position + 2
+            name = bytes(self.buffer[name_start:name_start + abs(name_length)]).decode("ascii", "replace").upper()
+            offset_position = name_start + abs(name_length)
+            offset = int(self.buffer[offset_position:offset_position + 2].view(self.endianness + "u2")[0])
+
+            if group_id < 0:
+                group_names[-group_id] = name
+            else:
+                group_parameters.setdefault(group_id, {})[name] = self.parse_parameter_value(offset_position + 2)
+
+            if offset == 0:
+                break
+            position = offset_position + offset
+
+        return {group_names.get(group_id, str(group_id)): parameters
+                for group_id, parameters in group_parameters.items()}
+
+    def parse_parameter_value(self, position):
+        """Parse the value of a parameter, starting at its element size byte."""
+
+        element_size = int(self.buffer[position:position + 1].view(np.int8)[0])
+        dimensions_number = int(self.buffer[position + 1])
+        dimensions = [int(d) for d in self.buffer[position + 2:position + 2 + dimensions_number]]
+        data_start = position + 2 + dimensions_number
+        count = int(np.prod(dimensions)) if dimensions else 1
+        data = self.buffer[data_start:data_start + count * abs(element_size)]
+
+        if element_size == -1:
+            characters = bytes(data).decode("ascii", "replace")
+            if dimensions_number <= 1:
+                return characters.strip()
+            length = dimensions[0]
+            if length == 0:
+                return []
+            return [characters[i:i + length].strip() for i in range(0, len(characters), length)]
+
+        if element_size == 1:
+            values = data.view(np.int8)
+        elif element_size == 2:
+            values = data.view(self.endianness + "i2")
+        else:
+            values = self.decode_floats(data)
+
+        if dimensions_number == 0:
+            return values[0]
+
+        # The dimensions of the c3d parameters are given in column major order
+        return values.reshape(dimensions[::-1]).T
+
+    def decode_floats(self, data):
+        """Decode 32 bits floats from raw bytes, according to the processor type of the file."""
+
+        if self.processor == DEC:
+            # DEC floats are IEEE floats with swapped 16 bits words and an exponent bias higher by 2
+            shuffled = np.empty(data.size, dtype=np.uint8)
+            shuffled[0::4] = data[2::4]
+            shuffled[1::4] = data[3::4]
+            shuffled[2::4] = data[0::4]
+            shuffled[3::4] = data[1::4]
+            return shuffled.view("<f4") / 4.
+
+        return data.view(self.endianness + "f4")
+
+    def get_parameter(self, group, name, default=None):
+        """Get the value of a parameter, or a default value if it is not defined in the file."""
+
+        return self.parameters.get(group, {}).get(name, default)
+
+    def get_labels(self, group, used):
+        """Get the labels of the points or analog channels, which may be split across the LABELS, LABELS2, ... parameters."""
+
+        labels = []
+        parameter_names = ["LABELS"] + ["LABELS{}".format(i) for i in range(2, 100)]
+        for parameter_name in parameter_names:
+            value = self.get_parameter(group, parameter_name)
+            if value is None:
+                break
+            labels.extend([value] if isinstance(value, str) else value)
+
+        return labels[:used]
+
+    def compute_analog_per_frame(self):
+        """Compute the number of analog samples per point frame."""
+
+        if self.analog_used == 0:
+            return 0
+        if self.header["analog_per_frame"] > 0:
+            return self.header["analog_per_frame"]
+
+        return self.header["analog_count"] // self.analog_used
+
+    def create_frame_dtype(self):
+        """Create the structured data type of a frame of the data section, i.e the point values followed by the analog samples."""
+
+        if self.is_float:
+            point_dtype = analog_dtype = np.dtype(self.endianness + "f4")
+            if self.processor == DEC:
+                point_dtype = analog_dtype = np.dtype("<u4")
+        else:
+            point_dtype = np.dtype(self.endianness + "i2")
+            analog_dtype = np.dtype(self.endianness + ("u2" if self.analog_unsigned else "i2"))
+
+        return np.dtype([("points", point_dtype, (self.point_used, 4)),
+                         ("analog", analog_dtype, (self.analog_per_frame, self.analog_used))])
+
+    def compute_expected_frame_number(self):
+        """Compute the number of frames announced by the header and the parameter section of the file."""
+
+        frames = self.header["last_frame"] - self.header["first_frame"] + 1
+
+        # The header frame numbers are 16 bits integers, longer acquisitions store them in the TRIAL group
+        start_field = self.get_parameter("TRIAL", "ACTUAL_START_FIELD")
+        end_field = self.get_parameter("TRIAL", "ACTUAL_END_FIELD")
+        if start_field is not None and end_field is not None and np.size(start_field) == np.size(end_field) == 2:
+            first_frame, last_frame = (int(words[0]) + int(words[1]) * 65536 for words in
+                                       (np.asarray(start_field).astype(np.uint16), np.asarray(end_field).astype(np.uint16)))
+            frames = max(frames, last_frame - first_frame + 1)
+
+        return max(frames, 0)
+
+    def compute_frame_number(self):
+        """Compute the number of frames, which is bounded by the size of the data section of truncated files."""
+
+        available_frames = max(self.buffer.size - self.data_offset, 0) // self.frame_dtype.itemsize
+
+        return min(self.expected_frames, available_frames)
+
+    def is_truncated(self):
+        """Check if the data section of the file is shorter than announced by its header."""
+
+        return self.frames < self.expected_frames
+
+    def GetPointFrequency(self):
+        return self.point_rate
+
+    def GetAnalogFrequency(self):
+        return self.analog_rate
+
+    def GetPointFrameNumber(self):
+        return self.frames
+
+    def GetAnalogFrameNumber(self):
+        return self.frames * self.analog_per_frame
+
+    def GetDuration(self):
+        return self.frames / self.point_rate if self.point_rate else 0.
+
+    def GetPointNumber(self):
+        return self.point_used
+
+    def GetAnalogNumber(self):
+        return self.analog_used
+
+    @staticmethod
+    def get_channel_index(labels, label, channel_type):
+        """Get the index of a channel from its label or index, as the biomechanical toolkit accepts both."""
+
+        if isinstance(label, (int, np.integer)):
+            if not 0 <= label < len(labels):
+                raise RuntimeError("No {} with index: {}".format(channel_type, label))
+            return int(label)
+
+        if label not in labels:
+            raise RuntimeError("No {} with label: {}".format(channel_type, label))
+
+        return labels.index(label)
+
+    def GetPoint(self, label):
+        """Get the (frames x 3) coordinates of a point."""
+
+        index = self.get_channel_index(self.point_labels, label, "point")
+        label = self.point_labels[index]
+        coordinates = self.data["points"][:, index, :3]
+
+        if self.processor == DEC and self.is_float:
+            coordinates = self.decode_floats(np.ascontiguousarray(coordinates).view(np.uint8)).reshape(-1, 3)
+        elif not self.is_float:
+            coordinates = coordinates * abs(self.point_scale)
+
+        return C3DChannel(label, coordinates)
+
+    def GetAnalog(self, label):
+        """Get the (samples x 1) values of an analog channel, scaled as specified by the file parameters."""
+
+        index = self.get_channel_index(self.analog_labels, label, "analog channel")
+        label = self.analog_labels[index]
+        samples = self.data["analog"][:, :, index]
+
+        if self.processor == DEC and self.is_float:
+            samples = self.decode_floats(np.ascontiguousarray(samples).view(np.uint8)).reshape(samples.shape)
+
+        # Without point data the analog samples of consecutive frames are evenly spaced and remain a view
+        samples = samples.reshape(-1, 1)
+
+        scale = self.get_analog_scale(index)
+        offset = self.get_analog_offset(index)
+        if scale != 1. or offset != 0 or not self.is_float:
+            samples = (samples - offset) * scale
+
+        return C3DChannel(label, samples)
+
+    def read_point(self, label, out):
+        """Read the coordinates of a point directly into a (frames x 3) output array, without intermediate array."""
+
+        index = self.get_channel_index(self.point_labels, label, "point")
+        coordinates = self.data["points"][:, index, :3]
+
+        if self.processor == DEC and self.is_float:
+            coordinates = self.decode_floats(np.ascontiguousarray(coordinates).view(np.uint8)).reshape(-1, 3)
+
+        np.multiply(coordinates, 1. if self.is_float else abs(self.point_scale), out=out, dtype=float)
+
+    def read_analog(self, label, out):
+        """
+        Read the scaled values of an analog channel directly into a (samples x 1) output array, without intermediate
+        array.
+        """
+
+        index = self.get_channel_index(self.analog_labels, label, "analog channel")
+        samples = self.data["analog"][:, :, index]
+
+        if self.processor == DEC and self.is_float:
+            samples = self.decode_floats(np.ascontiguousarray(samples).view(np.uint8)).reshape(samples.shape)
+
+        # The output column is reshaped in place to the (frames x samples per frame) layout of the data section
+        target = out[:, 0]
+        target.shape = samples.shape
+        np.subtract(samples, self.get_analog_offset(index), out=target, dtype=float)
+        target *= self.get_analog_scale(index)
+
+    def get_analog_scale(self, index):
+        """Get the scale factor of an analog channel."""
+
+        scales = np.atleast_1d(self.get_parameter("ANALOG", "SCALE", np.ones(self.analog_used)))
+        general_scale = float(self.get_parameter("ANALOG", "GEN_SCALE", 1.))
+
+        return float(scales[index]) * general_scale if index < scales.size else general_scale
+
+    def get_analog_offset(self, index):
+        """Get the offset of an analog channel."""
+
+        offsets = np.atleast_1d(self.get_parameter("ANALOG", "OFFSET", np.zeros(self.analog_used)))
+        if index >= offsets.size:
+            return 0
+
+        return int(np.uint16(offsets[index])) if self.analog_unsigned else int(offsets[index])
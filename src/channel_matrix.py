@@ -0,0 +1,59 @@
+# Third-party module imports
+import numpy as np
+
+
+class ChannelMatrix:
+    """
+    Values of several channels of an acquisition stored in a single C-contiguous (samples x channels) array.
+
+    The label index gives, for every label, the slice of the columns of its channel (one column for an analog channel, and
+    three columns for the x, y and z coordinates of a point). The channels can be accessed by label like the dictionaries
+    of channels values returned by the acquisition reader, without copy.
+    """
+
+    def __init__(self, values, label_index):
+        self.values = values
+        self.label_index = label_index
+
+    @classmethod
+    def from_channels(cls, labels, channels_number, samples_number, fill_channel, dtype=float):
+        """
+        Create a channel matrix by filling the columns of each channel in place, with a function which receives the label
+        and the (samples x channels_number) columns of the channel.
+        """
+
+        values = np.empty((samples_number, channels_number * len(labels)), dtype=dtype)
+        label_index = {label: slice(i * channels_number, (i + 1) * channels_number) for i, label in enumerate(labels)}
+
+        for label in labels:
+            fill_channel(label, values[:, label_index[label]])
+
+        return cls(values, label_index)
+
+    def __getitem__(self, label):
+        return self.values[:, self.label_index[label]]
+
+    def __contains__(self, label):
+        return label in self.label_index
+
+    def __iter__(self):
+        return iter(self.label_index)
+
+    def __len__(self):
+        return len(self.label_index)
+
+    def keys(self):
+        return self.label_index.keys()
+
+    def items(self):
+        return [(label, self[label]) for label in self.label_index]
+
+    def get_columns(self, labels):
+        """Get the (samples x channels) values of the given channels, which is a view when they are stored in that order."""
+
+        all_columns = np.arange(self.values.shape[1])
+        columns = np.concatenate([all_columns[self.label_index[label]] for label in labels])
+        if np.array_equal(columns, all_columns):
+            return self.values
+
+        return self.values[:, columns]
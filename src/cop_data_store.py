@@ -0,0 +1,244 @@
+# Built-in modules imports
+from utils import parse_trial_info
+from contextlib import contextmanager
+import csv
+import fcntl
+import hashlib
+import os
+
+# Third-party module imports
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("pipeline")
+
+
+class CopDataStore:
+    """
+    Study level container of the preprocessed COP data of all the trials, stored in a single folder.
+
+    The COP_x and COP_y arrays of every trial are appended one after the other to a single binary file of float64 values,
+    and every trial is recorded in an index table with its device, subject, trial and balance board, the offset and the
+    number of samples of its COP data in the binary file, its sampling frequency and the hash of its COP data.
+
+    The trials are identified by a key, i.e the path of the COP data file which they replace, so that they are processed
+    like the COP data files. They are read from a memory map of the binary file, either by key or in the order of the
+    index, which reads the binary file sequentially.
+
+    A trial which is stored again is appended, and only its last version is read. When the store is closed, the superseded
+    versions are removed from the index, and the binary file is compacted if they take more than a given fraction of it.
+    The appends, loads and compactions are serialized with a lock file, so that the store can be written by the parallel
+    workers of the pipelines, and an interrupted compaction is completed by the next one of them. The lock file is locked
+    with fcntl, so the store is only available on POSIX systems, e.g Linux and macOS, and not on Windows.
+
+    The index is loaded again whenever the index or the binary file changed on disk since it was loaded, e.g when a trial
+    is stored again or the store is compacted by another process, so that the offsets of the trials are never stale.
+    """
+
+    data_filename = "cop_data.bin"
+    index_filename = "index.csv"
+    lock_filename = ".lock"
+    compaction_extension = ".compact"
+
+    # Fraction of the binary file taken by superseded or unindexed data above which it is compacted when the store is closed
+    max_superseded_fraction = 0.25
+
+    index_columns = ["key", "device", "subject", "trial", "balance board", "offset", "samples",
+                     "acquisition_frequency", "hash"]
+
+    dtype = np.dtype("<f8")
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.index = None
+        self.data = None
+        self.signature = None
+
+    def __getstate__(self):
+        # The index and the memory map are loaded again by the worker processes
+        return {"folder": self.folder, "index": None, "data": None, "signature": None}
+
+    def append(self, key, cop_x, cop_y, acquisition_frequency):
+        """Append the COP data of a trial to the store."""
+
+        cop_data = np.concatenate([np.asarray(cop_x, dtype=self.dtype), np.asarray(cop_y, dtype=self.dtype)])
+        cop_data_hash = hashlib.sha1(cop_data.tobytes()).hexdigest()
+        trial_info = parse_trial_info(key)
+
+        os.makedirs(self.folder, exist_ok=True)
+        with self.locked():
+            # The data is written before its index row, so that an interrupted append is never indexed
+            with open(os.path.join(self.folder, self.data_filename), "ab") as data_file:
+                offset = data_file.seek(0, os.SEEK_END) // self.dtype.itemsize
+                data_file.write(cop_data.tobytes())
+
+            index_filepath = os.path.join(self.folder, self.index_filename)
+            new_index = not os.path.exists(index_filepath)
+            with open(index_filepath, "a", newline="") as index_file:
+                writer = csv.writer(index_file)
+                if new_index:
+                    writer.writerow(self.index_columns)
+                writer.writerow([key, trial_info["device"], trial_info["subject"], trial_info["trial"],
+                                 trial_info["balance board"], offset, len(cop_x), acquisition_frequency,
+                                 cop_data_hash])
+
+    @contextmanager
+    def locked(self):
+        """Get the context in which the store is locked, after completing any interrupted compaction."""
+
+        with open(os.path.join(self.folder, self.lock_filename), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.complete_compaction()
+            yield
+
+    def read_index(self):
+        """Read the index table of the last versions of the trials, in the order of the binary file."""
+
+        index = pd.read_csv(os.path.join(self.folder, self.index_filename),
+                            dtype={"device": str, "subject": str, "trial": str, "balance board": str})
+
+        return index.drop_duplicates("key", keep="last").sort_values("offset")
+
+    def write_index(self, index, index_filepath):
+        index.to_csv(index_filepath, index=False, columns=self.index_columns)
+
+    def get_signature(self):
+        """Get the signature of the files of the store, i.e the modification time and size of the index and binary file."""
+
+        signature = []
+        for filename in [self.index_filename, self.data_filename]:
+            try:
+                stat = os.stat(os.path.join(self.folder, filename))
+                signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+
+        return tuple(signature)
+
+    def load(self):
+        """Load the index of the last versions of the trials, and memory map the binary file."""
+
+        index_filepath = os.path.join(self.folder, self.index_filename)
+        if not os.path.exists(index_filepath):
+            self.index = pd.DataFrame(columns=self.index_columns).set_index("key")
+            self.data = np.zeros((0,), dtype=self.dtype)
+            self.signature = self.get_signature()
+            return
+
+        # The memory map keeps the binary file which matches the index, even if it is compacted afterwards
+        with self.locked():
+            self.index = self.read_index().set_index("key")
+            self.data = np.memmap(os.path.join(self.folder, self.data_filename), dtype=self.dtype, mode="r")
+            self.signature = self.get_signature()
+
+    def close(self):
+        """
+        Remove the superseded versions of the trials from the index, and compact the binary file if the superseded or
+        unindexed data takes more than the maximum superseded fraction of it.
+        """
+
+        index_filepath = os.path.join(self.folder, self.index_filename)
+        if not os.path.exists(index_filepath):
+            return
+
+        with self.locked():
+            index = self.read_index()
+            data_size = os.path.getsize(os.path.join(self.folder, self.data_filename)) // self.dtype.itemsize
+            superseded_size = data_size - 2 * int(index["samples"].sum())
+
+            if superseded_size > self.max_superseded_fraction * data_size:
+                logger.info("Compacting the COP data store: {} superseded values out of {}".format(superseded_size,
+                                                                                                    data_size))
+                self.compact(index)
+            else:
+                self.write_index(index, index_filepath + self.compaction_extension)
+                os.replace(index_filepath + self.compaction_extension, index_filepath)
+
+        self.index = None
+        self.data = None
+        self.signature = None
+
+    def compact(self, index):
+        """
+        Rewrite the binary file with the last versions of the trials only, and the index with their new offsets.
+
+        The compacted files are written next to the current ones, and replace them once they are complete, the binary file
+        first. The compacted index is written last, so that its presence means that the compaction can be completed.
+        """
+
+        data_filepath = os.path.join(self.folder, self.data_filename)
+        index_filepath = os.path.join(self.folder, self.index_filename)
+        data = np.memmap(data_filepath, dtype=self.dtype, mode="r")
+
+        offsets = []
+        with open(data_filepath + self.compaction_extension, "wb") as data_file:
+            for offset, samples in zip(index["offset"], index["samples"]):
+                offsets.append(data_file.tell() // self.dtype.itemsize)
+                data_file.write(data[offset:offset + 2 * samples].tobytes())
+            data_file.flush()
+            os.fsync(data_file.fileno())
+        del data
+
+        self.write_index(index.assign(offset=offsets), index_filepath + self.compaction_extension)
+        self.complete_compaction()
+
+    def complete_compaction(self):
+        """Replace the binary file and the index with their compacted versions, or discard an incomplete compaction."""
+
+        data_filepath = os.path.join(self.folder, self.data_filename)
+        index_filepath = os.path.join(self.folder, self.index_filename)
+
+        if os.path.exists(index_filepath + self.compaction_extension):
+            if os.path.exists(data_filepath + self.compaction_extension):
+                os.replace(data_filepath + self.compaction_extension, data_filepath)
+            os.replace(index_filepath + self.compaction_extension, index_filepath)
+        elif os.path.exists(data_filepath + self.compaction_extension):
+            os.remove(data_filepath + self.compaction_extension)
+
+    def get_index(self):
+        # The index is loaded again when the files of the store have changed since it was loaded, e.g when a trial has
+        # been appended again or the store has been compacted, which moves the offsets of the trials
+        if self.index is None or self.get_signature() != self.signature:
+            self.load()
+
+        return self.index
+
+    def keys(self, **trial_info):
+        """Get the keys of the trials in the order of the binary file, optionally selected by trial information."""
+
+        index = self.get_index()
+        for column, value in trial_info.items():
+            index = index[index[column.replace("_", " ")] == str(value)]
+
+        return index.index.tolist()
+
+    def __contains__(self, key):
+        return key in self.get_index().index
+
+    def __len__(self):
+        return len(self.get_index())
+
+    def get_entry(self, key):
+        return self.get_index().loc[key]
+
+    def get(self, key):
+        """Get the COP_x and COP_y arrays of a trial, as views of the memory map of the binary file."""
+
+        entry = self.get_entry(key)
+        offset, samples = int(entry["offset"]), int(entry["samples"])
+
+        return self.data[offset:offset + samples], self.data[offset + samples:offset + 2 * samples]
+
+    def get_hash(self, key):
+        return self.get_entry(key)["hash"]
+
+    def iterate(self, keys=None):
+        """Iterate over the keys and the COP data of the given trials, or of all the trials, in the order of the store."""
+
+        if keys is None:
+            keys = self.keys()
+
+        for key in sorted(keys, key=lambda key: self.get_entry(key)["offset"]):
+            cop_x, cop_y = self.get(key)
+            yield key, cop_x, cop_y
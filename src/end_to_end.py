@@ -0,0 +1,153 @@
+# Built-in modules imports
+from end_to_end_pipeline import EndToEndPipeline
+from plot_renderer import PlotRenderer
+from stage_timer import StageTimer
+from file_profiler import FileProfiler
+from utils import load_config, get_path_to_all_files, setup_logging, check_folder
+
+# Third-party module imports
+from argparse import ArgumentParser
+import logging
+
+setup_logging()
+logger = logging.getLogger("end to end pipeline")
+
+
+if __name__ == "__main__":
+
+    ##################
+    # Boilerplate code
+    ##################
+
+    # Load configuration file
+    config = load_config()
+
+    # Data folder path
+    data_folder = config["acquisition_data_folder"]
+
+    # Results folder path
+    results_folder = config["feature_results_folder"]
+    check_folder(results_folder)
+
+    # Command line argument parser to choose between wbb or force plate data
+    parser = ArgumentParser(
+        description="")
+    parser.add_argument("-w", "--wbb", action='store_true', help="Process WBB data")
+    parser.add_argument("-d", "--debug", action='store_true', help="Enable debug mode")
+    parser.add_argument("-i", "--incremental", action='store_true',
+                        help="Only process the files whose outputs are outdated")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of worker processes used to process the files")
+    parser.add_argument("-c", "--save-cop", action='store_true', help="Save the intermediate COP data")
+    parser.add_argument("-s", "--scan", action='store_true',
+                        help="Scan the acquisition files headers, save the manifest and only process the valid files, "
+                             "the longest first")
+    parser.add_argument("--timing", metavar="FILE",
+                        help="Time the processing stages of every file and save the records to a csv or json file")
+    parser.add_argument("--profile", metavar="GLOB|N",
+                        help="Profile the processing of the files matching a glob pattern, or of the N slowest files")
+    plots_group = parser.add_mutually_exclusive_group()
+    plots_group.add_argument("-b", "--background-plots", action='store_true',
+                             help="Render the plots in a background process")
+    plots_group.add_argument("-n", "--no-plots", action='store_true', help="Do not render the plots")
+
+    args = parser.parse_args()
+    WBB = args.wbb
+    debug = args.debug
+    incremental = args.incremental
+    save_cop = args.save_cop
+    scan = args.scan
+    jobs = args.jobs
+
+    if args.no_plots:
+        plot_mode = "none"
+    elif args.background_plots:
+        plot_mode = "background"
+    else:
+        plot_mode = "inline"
+
+    if debug:
+        logger.setLevel("DEBUG")
+
+    ################
+    # Files handling
+    ################
+
+    # Get all the paths to the files that need to be processed
+    files = get_path_to_all_files(data_folder)
+
+    # Separate WBB and force plate data
+    wbb_files = [file for file in files if "FP" not in file]
+
+    fp_files = [file for file in files if "FP" in file and "RSSCAN" not in file]
+
+    # Create the pipeline object
+    plot_renderer = PlotRenderer(plot_mode)
+    file_profiler = FileProfiler(args.profile)
+    # The slowest files to profile are selected from the stages timing of the run
+    stage_timer = StageTimer(enabled=args.timing is not None or file_profiler.slowest_files_number > 0)
+    data_pipeline = EndToEndPipeline(save_cop_data=save_cop, plot_renderer=plot_renderer, stage_timer=stage_timer,
+                                     file_profiler=file_profiler)
+
+    # Optionally scan the headers of the files, to reject the invalid recordings and process the longest ones first
+    if scan:
+        manifest = data_pipeline.scan_acquisition_headers(wbb_files if WBB else fp_files,
+                                                          manifest_path=config["acquisition_manifest_file"])
+        logger.info("Acquisition files manifest saved to: {}".format(config["acquisition_manifest_file"]))
+
+        for _, rejected_file in manifest[~manifest["valid"]].iterrows():
+            logger.warning("Rejected acquisition file: {} ({})".format(rejected_file["filepath"],
+                                                                       rejected_file["error"]))
+
+        acquisition_files = manifest.loc[manifest["valid"], "filepath"].tolist()
+    else:
+        acquisition_files = wbb_files if WBB else fp_files
+
+    # Only process the files to profile when they are selected with a glob pattern
+    acquisition_files = file_profiler.select_files(acquisition_files)
+
+    ######################################
+    # Preprocessing and feature extraction
+    ######################################
+
+    logger.info("Executing end to end pipeline.")
+    logger.info("Processing acquisition data located in: {}".format(data_folder))
+
+    if WBB:
+        logger.info("Beginning of Wii Balance Board acquisition data processing")
+
+        # Assign WBB data to the pipeline object
+        data_pipeline.set_pipeline_acquisition_data(acquisition_files)
+
+        # Preprocess and compute the features of all the WBB data
+        data_pipeline.preprocess_all_files(logger, balance_board=True, jobs=jobs, incremental=incremental)
+
+        logger.info("End of Wii Balance Board acquisition data processing")
+
+    else:
+        logger.info("Beginning of Force Plate acquisition data processing")
+
+        # Assign force plate data to the pipeline object
+        data_pipeline.set_pipeline_acquisition_data(acquisition_files)
+
+        # Preprocess and compute the features of all the force plate data
+        data_pipeline.preprocess_all_files(logger, jobs=jobs, incremental=incremental)
+
+        logger.info("End of Force Plate acquisition data processing")
+
+    # Save and summarize the processing stages timing
+    if args.timing is not None:
+        summary_filepath = stage_timer.save(args.timing)
+        summary = stage_timer.summarize().to_string(float_format="{:.4f}".format)
+        logger.info("Processing stages timing (s):\n{}".format(summary))
+        logger.info("Processing stages timing saved to: {} and {}".format(args.timing, summary_filepath))
+
+    # Process the slowest files again with their processing being profiled
+    if file_profiler.slowest_files_number > 0:
+        slowest_files = file_profiler.select_slowest_files(stage_timer.records)
+        data_pipeline.profile_acquisition_files(logger, slowest_files, balance_board=WBB)
+
+    # Wait for the plots rendered in the background
+    plot_renderer.close()
+
+    logger.info("Saving results to: {}".format(results_folder))
@@ -0,0 +1,81 @@
+# Built-in modules imports
+from preprocessing_pipeline import PreprocessingPipeline
+from feature_extraction_pipeline import FeatureExtractionPipeline
+from processing_manifest import ProcessingManifest
+from stage_timer import StageTimer
+
+# Third-party module imports
+import logging
+import warnings
+
+logger = logging.getLogger("pipeline")
+
+
+class EndToEndPipeline(PreprocessingPipeline, FeatureExtractionPipeline):
+    """
+    Class that pipelines all the data processing steps from acquisition file reading to feature extraction in memory.
+
+    The preprocessed COP data is passed directly to the time and frequency features computations instead of being saved
+    to a COP data file and parsed again, and is only saved if specified. The features and plots are saved to the same
+    files as with the preprocessing and feature extraction pipelines run one after the other.
+    """
+
+    output_config_sections = PreprocessingPipeline.output_config_sections + \
+        ["time_features_parameters", "frequency_features_parameters"]
+    output_modules = PreprocessingPipeline.output_modules + FeatureExtractionPipeline.output_modules + \
+        ["end_to_end_pipeline"]
+
+    def __init__(self, acquisition_files=None, save_cop_data=False, plot_renderer=None, stage_timer=None,
+                 file_profiler=None):
+        super(EndToEndPipeline, self).__init__(acquisition_files, plot_renderer, stage_timer, file_profiler)
+        self.save_cop_data = save_cop_data
+
+    def build_output_filepath(self, filepath):
+        """Build the path of the features file of an acquisition file, which is recorded by the incremental processing."""
+
+        return FeatureExtractionPipeline.build_output_filepath(self.build_cop_data_filepath(filepath))
+
+    def open_processing_manifest(self):
+        """Open the processing manifest, whose outputs are the features files."""
+
+        return ProcessingManifest(self.processing_manifest_file, self.output_modules)
+
+    def run_acquisition_file_preprocessing(self, filepath, balance_board=False):
+        """Run the preprocessing and feature extraction steps of an acquisition file, without handling the errors."""
+
+        preprocessed_cop_data = self.preprocess_acquisition(filepath, balance_board)
+
+        # Optionally save the intermediate COP data
+        if self.save_cop_data:
+            with self.stage_timer.stage("save cop data"):
+                self.save_preprocessed_cop_data(preprocessed_cop_data, filepath)
+
+        # Plot and save the stabilograms
+        with self.stage_timer.stage("plot stabilograms"):
+            self.plot_preprocessed_cop_data(preprocessed_cop_data, filepath, balance_board)
+
+        # The feature extraction steps are run with the default warnings filters, like when the feature extraction
+        # pipeline is run on its own, instead of the preprocessing ones which turn the warnings into errors
+        with warnings.catch_warnings():
+            warnings.simplefilter("default")
+            self.run_cop_data_features_extraction(preprocessed_cop_data, self.build_cop_data_filepath(filepath))
+
+    def run_cop_data_features_extraction(self, preprocessed_cop_data, cop_data_filepath):
+        """Compute the time and frequency features of in memory COP data, and save them with the spectral densities plot."""
+
+        processed_data, frequencies, spectrums = self.compute_cop_features(preprocessed_cop_data["COP_x"],
+                                                                           preprocessed_cop_data["COP_y"],
+                                                                           cop_data_filepath)
+
+        # Save features computations in json format
+        with self.stage_timer.stage("save features"):
+            self.save_features(processed_data, cop_data_filepath)
+
+        # Plot and save the spectral densities
+        logger.debug("Saving spectral density plot to file: {}".format(cop_data_filepath))
+        with self.stage_timer.stage("plot spectral densities"):
+            self.plot_renderer.plot_spectral_densities(frequencies, spectrums, cop_data_filepath)
+
+    def get_worker_arguments(self):
+        return {"save_cop_data": self.save_cop_data, "plot_renderer": self.plot_renderer,
+                "stage_timer": StageTimer(self.stage_timer.enabled), "file_profiler": self.file_profiler}
@@ -1,5 +1,8 @@
 # Built-in modules imports
 from feature_extraction_pipeline import FeatureExtractionPipeline
+from plot_renderer import PlotRenderer
+from stage_timer import StageTimer
+from file_profiler import FileProfiler
 from utils import load_config, get_path_to_all_files, setup_logging, check_folder
 
 # Third-party module imports
@@ -31,10 +34,34 @@ if __name__ == "__main__":
         description="")
     parser.add_argument("-w", "--wbb", action='store_true', help="Process WBB data")
     parser.add_argument("-d", "--debug", action='store_true', help="Enable debug mode")
+    parser.add_argument("-i", "--incremental", action='store_true',
+                        help="Only process the files whose outputs are outdated")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of worker processes used to compute the features")
+    parser.add_argument("-t", "--io-threads", type=int, default=0,
+                        help="Number of threads used to save the features when several jobs are used")
+    parser.add_argument("--timing", metavar="FILE",
+                        help="Time the processing stages of every file and save the records to a csv or json file")
+    parser.add_argument("--profile", metavar="GLOB|N",
+                        help="Profile the processing of the files matching a glob pattern, or of the N slowest files")
+    plots_group = parser.add_mutually_exclusive_group()
+    plots_group.add_argument("-b", "--background-plots", action='store_true',
+                             help="Render the plots in a background process")
+    plots_group.add_argument("-n", "--no-plots", action='store_true', help="Do not render the plots")
 
     args = parser.parse_args()
     WBB = args.wbb
     debug = args.debug
+    incremental = args.incremental
+    jobs = args.jobs
+    io_threads = args.io_threads
+
+    if args.no_plots:
+        plot_mode = "none"
+    elif args.background_plots:
+        plot_mode = "background"
+    else:
+        plot_mode = "inline"
 
     if debug:
         logger.setLevel("DEBUG")
@@ -43,8 +70,15 @@ if __name__ == "__main__":
     # Files handling
     ################
 
-    # Get all the paths to the files that need to be processed
-    files = get_path_to_all_files(data_folder)
+    # Get all the paths to the files that need to be processed, or the keys of the trials of the COP data store
+    if FeatureExtractionPipeline.use_cop_data_store:
+        files = FeatureExtractionPipeline.cop_data_store.keys()
+    else:
+        files = FeatureExtractionPipeline.select_cop_data_files(get_path_to_all_files(data_folder))
+
+    # Only process the files to profile when they are selected with a glob pattern
+    file_profiler = FileProfiler(args.profile)
+    files = file_profiler.select_files(files)
 
     # Separate WBB and force plate data
     wbb_files = [file for file in files if "FP" not in file]
@@ -59,7 +93,11 @@ if __name__ == "__main__":
     logger.info("Processing COP data located in: {}".format(data_folder))
 
     # Create the pipeline object
-    data_pipeline = FeatureExtractionPipeline()
+    plot_renderer = PlotRenderer(plot_mode)
+    # The slowest files to profile are selected from the stages timing of the run
+    stage_timer = StageTimer(enabled=args.timing is not None or file_profiler.slowest_files_number > 0)
+    data_pipeline = FeatureExtractionPipeline(plot_renderer=plot_renderer, stage_timer=stage_timer,
+                                              file_profiler=file_profiler)
 
     if WBB:
         logger.info("Beginning of Wii Balance Board COP data processing")
@@ -68,7 +106,7 @@ if __name__ == "__main__":
         data_pipeline.set_pipeline_cop_data(wbb_files)
 
         # Process all the WBB data
-        data_pipeline.process_all_files(logger)
+        data_pipeline.process_all_files(logger, jobs=jobs, io_threads=io_threads, incremental=incremental)
 
         logger.info("End of Wii Balance Board COP data processing")
 
@@ -79,8 +117,23 @@ if __name__ == "__main__":
         data_pipeline.set_pipeline_cop_data(fp_files)
 
         # Process all the force plate data
-        data_pipeline.process_all_files(logger)
+        data_pipeline.process_all_files(logger, jobs=jobs, io_threads=io_threads, incremental=incremental)
 
         logger.info("End of Force Plate COP data processing")
 
+    # Save and summarize the processing stages timing
+    if args.timing is not None:
+        summary_filepath = stage_timer.save(args.timing)
+        summary = stage_timer.summarize().to_string(float_format="{:.4f}".format)
+        logger.info("Processing stages timing (s):\n{}".format(summary))
+        logger.info("Processing stages timing saved to: {} and {}".format(args.timing, summary_filepath))
+
+    # Process the slowest files again with their processing being profiled
+    if file_profiler.slowest_files_number > 0:
+        slowest_files = file_profiler.select_slowest_files(stage_timer.records)
+        data_pipeline.profile_cop_data_files(logger, slowest_files)
+
+    # Wait for the plots rendered in the background
+    plot_renderer.close()
+
     logger.info("Saving results to: {}".format(results_folder))
@@ -1,8 +1,17 @@
 # Built-in modules imports
 from hybrid_reader import HybridAcquisitionReader
 from processor import DataProcessor
-from utils import save_as_json, plot_stabilograms, plot_spectral_densities
+from features import CopFeatures
+from cop_data_store import CopDataStore
+from processing_manifest import ProcessingManifest
+from plot_renderer import PlotRenderer
+from stage_timer import StageTimer
+from file_profiler import FileProfiler
+from utils import load_config, save_as_json, build_filepath, parse_trial_info
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import traceback
+import time
 import sys
 
 # Third-party module imports
@@ -10,61 +19,317 @@ import logging
 
 logger = logging.getLogger("pipeline")
 
+config = load_config()
+
+# Pipeline object of the current worker process, when the features are extracted in parallel
+worker_pipeline = None
+
+
+def initialize_worker(pipeline_arguments):
+    """Create the pipeline object of a worker process."""
+
+    global worker_pipeline
+    worker_pipeline = FeatureExtractionPipeline(**pipeline_arguments)
+
+
+def process_cop_data_file_in_worker(filepath):
+    """
+    Compute the features of a COP data file and plot its spectral densities in a worker process, and return the features
+    to be saved by the parent process, or the error message if the processing failed, along with the stages timing record
+    of the file.
+    """
+
+    try:
+        with worker_pipeline.stage_timer.file(filepath), \
+                worker_pipeline.file_profiler.profile(filepath, worker_pipeline.build_output_filepath(filepath)):
+            processed_data, frequencies, spectrums = worker_pipeline.compute_cop_data_file_features(filepath)
+
+            logger.debug("Saving spectral density plot to file: {}".format(filepath))
+            with worker_pipeline.stage_timer.stage("plot spectral densities"):
+                worker_pipeline.plot_renderer.plot_spectral_densities(frequencies, spectrums, filepath)
+    except Exception as err:
+        return filepath, None, "{} \n{}".format(err, traceback.format_exc()), worker_pipeline.stage_timer.pop_record()
+
+    return filepath, processed_data, None, worker_pipeline.stage_timer.pop_record()
+
 
 class FeatureExtractionPipeline(HybridAcquisitionReader, DataProcessor):
     """
     Class that pipelines all the different data processing steps from acquisition file reading to feature extraction.
     """
 
-    def __init__(self, preprocessed_files=None):
+    processing_manifest_file = config["processing_manifest_file"]
+
+    # The COP data is read from the study level COP data store, by the keys of its trials, if it is the COP data format
+    use_cop_data_store = config["cop_data_format"] == "store"
+    # Extensions of the COP data files of the configured COP data format, and of all the COP data file formats
+    cop_data_extension = "_cop.{}".format(config["cop_data_format"])
+    cop_data_extensions = ["_cop.json", "_cop.npz"]
+    cop_data_store = CopDataStore(config["cop_data_store_folder"])
+
+    # Configuration sections which the outputs depend on, for the incremental processing: the preprocessing parameters
+    # are included so that the features are computed again whenever the COP data preprocessing changes
+    output_config_sections = ["preprocessing_parameters", "time_features_parameters", "frequency_features_parameters"]
+
+    # Source modules which the outputs depend on, i.e the reading of the COP data and the features computations
+    output_modules = ["features", "time_features", "frequency_features", "processor", "feature_extraction_pipeline"]
+
+    def __init__(self, preprocessed_files=None, plot_renderer=None, stage_timer=None, file_profiler=None):
         super(FeatureExtractionPipeline, self).__init__()
         self.cop_data = preprocessed_files
+        self.plot_renderer = plot_renderer if plot_renderer is not None else PlotRenderer()
+        self.file_profiler = file_profiler if file_profiler is not None else FileProfiler()
+        if stage_timer is not None:
+            self.stage_timer = stage_timer
+
+    def process_cop_data_file(self, filepath, cop_data=None):
+        """
+        Pipeline the COP data processing, i.e the time and frequency feature extraction steps, and save the results to a json file.
 
-    def process_cop_data_file(self, filepath):
+        The COP_x and COP_y arrays of the file can be given, e.g when they are read from the COP data store. Returns
+        whether the processing succeeded.
         """
-        Pipeline the COP data processing, i.e the time and frequency feature extraction steps, and save the results to a json file."""
 
         try:
-            # Compute time features from COP displacement
-            time_features = self.compute_time_features(filepath)
+            with self.stage_timer.file(filepath), \
+                    self.file_profiler.profile(filepath, self.build_output_filepath(filepath)):
+                processed_data, frequencies, spectrums = self.compute_cop_data_file_features(filepath, cop_data)
+
+                # Save features computations in json format
+                with self.stage_timer.stage("save features"):
+                    self.save_features(processed_data, filepath)
+
+                # Plot and save the spectral densities
+                logger.debug("Saving spectral density plot to file: {}".format(filepath))
+                with self.stage_timer.stage("plot spectral densities"):
+                    self.plot_renderer.plot_spectral_densities(frequencies, spectrums, filepath)
 
-            # Compute frequency features from COP displacement
-            frequency_domain_features = self.compute_frequency_features(filepath)
-            frequency_features = frequency_domain_features.frequency_features
+        except Exception as err:
+            logger.error(": {} \n Problem with file:{}".format(err, filepath), exc_info=True, stack_info=True)
+            return False
 
-            file_info = self.parse_filepath(filepath)
+        return True
 
-            processed_data = {**file_info, "time_features": time_features, "frequency_features": frequency_features}
+    def compute_cop_data_file_features(self, filepath, cop_data=None):
+        """
+        Compute the time and frequency features of a COP data file, or of a trial of the COP data store identified by the
+        path of its COP data file, and return them with the frequencies and the spectral densities in the ML, AP and
+        resultant distance directions. The COP_x and COP_y arrays are read unless they are given.
+        """
 
-            # Save features computations in json format
-            logger.debug("Saving time and frequency features to file: {}".format(filepath))
-            save_as_json(processed_data, filepath, folder_to_replace="cop_data",
-                         destination_folder="feature_data", name_extension="_features.json")
+        with self.stage_timer.stage("read cop data"):
+            if cop_data is not None:
+                cop_x, cop_y = cop_data
+            elif self.use_cop_data_store:
+                cop_x, cop_y = self.cop_data_store.get(filepath)
+            else:
+                cop_x, cop_y = CopFeatures.parse_cop_data(filepath)
 
-            # Plot and save the spectral densities
-            spectral_densities = ["ml_spectral_density", "ap_spectral_density", "rd_spectral_density"]
-            spectrums_and_frequencies = [getattr(frequency_domain_features, spectral_density) for spectral_density in
-                                         spectral_densities]
-            frequencies = [sd[0] for sd in spectrums_and_frequencies]
-            spectrums = [sd[1] for sd in spectrums_and_frequencies]
+        return self.compute_cop_features(cop_x, cop_y, filepath)
 
-            logger.debug("Saving spectral density plot to file: {}".format(filepath))
-            plot_spectral_densities(frequencies, spectrums, filepath=filepath)
+    def compute_cop_features(self, cop_x, cop_y, filepath):
+        """
+        Compute the time and frequency features of in memory COP data, identified by the path of its COP data file, and
+        return them with the frequencies and the spectral densities in the ML, AP and resultant distance directions.
+        """
 
-        except Exception as err:
-            logger.error(": {} \n Problem with file:{}".format(err, filepath), exc_info=True, stack_info=True)
+        # Compute time features from COP displacement
+        with self.stage_timer.stage("time features"):
+            time_features = self.compute_time_features_from_cop_data(cop_x, cop_y)
+
+        # Compute frequency features from COP displacement
+        with self.stage_timer.stage("frequency features"):
+            frequency_domain_features = self.compute_frequency_features_from_cop_data(cop_x, cop_y)
+        frequency_features = frequency_domain_features.frequency_features
+
+        file_info = self.parse_filepath(filepath)
+
+        processed_data = {**file_info, "time_features": time_features, "frequency_features": frequency_features}
+
+        spectral_densities = ["ml_spectral_density", "ap_spectral_density", "rd_spectral_density"]
+        spectrums_and_frequencies = [getattr(frequency_domain_features, spectral_density) for spectral_density in
+                                     spectral_densities]
+        frequencies = [sd[0] for sd in spectrums_and_frequencies]
+        spectrums = [sd[1] for sd in spectrums_and_frequencies]
+
+        return processed_data, frequencies, spectrums
+
+    @staticmethod
+    def save_features(processed_data, filepath):
+        """Save the features of a COP data file in json format."""
+
+        logger.debug("Saving time and frequency features to file: {}".format(filepath))
+        save_as_json(processed_data, filepath, folder_to_replace="cop_data",
+                     destination_folder="feature_data", name_extension="_features.json")
+
+    def save_recorded_features(self, processed_data, filepath, timing_record):
+        """Save the features of a COP data file processed by a worker process, and time it in the timing record of the file."""
+
+        with self.stage_timer.record_stage(timing_record, "save features"):
+            self.save_features(processed_data, filepath)
+
+    @staticmethod
+    def build_output_filepath(filepath):
+        """Build the path of the features file of a COP data file, which is recorded by the incremental processing."""
 
-    def process_all_files(self, external_logger):
-        """Compute features from all preprocessed files."""
+        return build_filepath(filepath, folder_to_replace="cop_data", destination_folder="feature_data",
+                              name_extension="_features.json")
+
+    def get_worker_arguments(self):
+        """Get the arguments used to create the pipeline objects of the worker processes."""
+
+        return {"plot_renderer": self.plot_renderer, "stage_timer": StageTimer(self.stage_timer.enabled),
+                "file_profiler": self.file_profiler}
+
+    def open_processing_manifest(self):
+        """Open the processing manifest, whose inputs are the keys of the COP data store if it is used."""
+
+        if self.use_cop_data_store:
+            return ProcessingManifest(self.processing_manifest_file, self.output_modules,
+                                      compute_input_hash=self.cop_data_store.get_hash)
+
+        return ProcessingManifest(self.processing_manifest_file, self.output_modules)
+
+    def process_all_files(self, external_logger, jobs=1, io_threads=0, incremental=False):
+        """
+        Compute features from all preprocessed files, in a pool of worker processes if several jobs are used, and report
+        the throughput of the feature extraction.
+
+        In incremental mode, only the files whose features are outdated according to the processing manifest are
+        processed, i.e the new or modified COP data files, or all the files when the configuration or the code changed.
+        """
 
         if self.cop_data is not None:
-            for cop_data_file in tqdm(self.cop_data):
-                external_logger.debug("Processing COP data file: {}".format(cop_data_file))
-                self.process_cop_data_file(cop_data_file)
+            start_time = time.perf_counter()
+            cop_data_files = self.cop_data
+
+            if incremental:
+                manifest = self.open_processing_manifest()
+                keys, cop_data_files = manifest.select_outdated_files(cop_data_files, self.build_output_filepath,
+                                                                      self.output_config_sections)
+                external_logger.info("{} COP data files up to date, {} to process".format(
+                    len(self.cop_data) - len(cop_data_files), len(cop_data_files)))
+
+            if jobs > 1:
+                failed_files = self.process_all_files_in_parallel(external_logger, jobs, io_threads, cop_data_files)
+            else:
+                failed_files = []
+                for cop_data_file, cop_data in tqdm(self.iterate_cop_data(cop_data_files), total=len(cop_data_files)):
+                    external_logger.debug("Processing COP data file: {}".format(cop_data_file))
+                    if not self.process_cop_data_file(cop_data_file, cop_data):
+                        failed_files.append(cop_data_file)
+
+            if incremental:
+                manifest.record_processed_files(keys, cop_data_files, failed_files, self.build_output_filepath)
+
+            elapsed_time = time.perf_counter() - start_time
+            external_logger.info("Processed {} COP data files in {:.1f} s ({:.2f} files/s)".format(
+                len(cop_data_files), elapsed_time, len(cop_data_files) / elapsed_time if elapsed_time > 0 else 0.))
         else:
             external_logger.critical("No files to process.")
             sys.exit()
 
+    def iterate_cop_data(self, cop_data_files):
+        """
+        Iterate over the COP data files and their COP_x and COP_y arrays if they are read from the COP data store, in the
+        order of the store so that its binary file is read sequentially, or else over the files with no COP data, which
+        is read by the processing of every file.
+
+        The files missing from the store come first, with no COP data, so that their processing reports them as failed.
+        """
+
+        if not self.use_cop_data_store:
+            for cop_data_file in cop_data_files:
+                yield cop_data_file, None
+            return
+
+        stored_files = []
+        for cop_data_file in cop_data_files:
+            if cop_data_file in self.cop_data_store:
+                stored_files.append(cop_data_file)
+            else:
+                yield cop_data_file, None
+
+        for cop_data_file, cop_x, cop_y in self.cop_data_store.iterate(stored_files):
+            yield cop_data_file, (cop_x, cop_y)
+
+    def process_all_files_in_parallel(self, external_logger, jobs=2, io_threads=0, cop_data_files=None):
+        """
+        Compute features from all preprocessed files in a pool of worker processes.
+
+        The time and frequency features are computed and the spectral densities are plotted by the worker processes, and
+        the features are saved by the parent process, in a pool of threads if I/O threads are used. The errors of every
+        file are isolated and reported by the parent process in the order of the files. Returns the list of the files
+        whose processing failed.
+        """
+
+        if cop_data_files is None:
+            cop_data_files = self.cop_data
+
+        external_logger.debug("Processing {} COP data files with {} jobs".format(len(cop_data_files), jobs))
+        outcomes = []
+
+        with ProcessPoolExecutor(max_workers=jobs, initializer=initialize_worker,
+                                 initargs=(self.get_worker_arguments(),)) as executor, \
+                ThreadPoolExecutor(max_workers=max(io_threads, 1)) as io_executor:
+            results = executor.map(process_cop_data_file_in_worker, cop_data_files)
+
+            # The outcome of every file is its error message, or the saving of its features in a pool of threads, which
+            # is timed in the stages timing record of the file
+            for cop_data_file, processed_data, error, timing_record in tqdm(results, total=len(cop_data_files)):
+                external_logger.debug("Processed COP data file: {}".format(cop_data_file))
+                saving = None
+                if error is None and io_threads > 0:
+                    saving = io_executor.submit(self.save_recorded_features, processed_data, cop_data_file,
+                                                timing_record)
+                elif error is None:
+                    try:
+                        self.save_recorded_features(processed_data, cop_data_file, timing_record)
+                    except Exception as err:
+                        error = "{} \n{}".format(err, traceback.format_exc())
+                outcomes.append((cop_data_file, error, saving, timing_record))
+
+            # The errors are reported, and the failed files listed, in the order of the files
+            failed_files = []
+            for cop_data_file, error, saving, timing_record in outcomes:
+                if saving is not None:
+                    try:
+                        saving.result()
+                    except Exception as err:
+                        error = "{} \n{}".format(err, traceback.format_exc())
+                self.stage_timer.add_record(timing_record)
+                if error is not None:
+                    logger.error(": {} \n Problem with file:{}".format(error, cop_data_file))
+                    failed_files.append(cop_data_file)
+
+        return failed_files
+
+    def profile_cop_data_files(self, external_logger, cop_data_files):
+        """Process COP data files again, e.g the slowest files of a run, with their processing being profiled."""
+
+        for cop_data_file in cop_data_files:
+            external_logger.info("Profiling the processing of COP data file: {}".format(cop_data_file))
+            self.process_cop_data_file(cop_data_file)
+
+    @classmethod
+    def select_cop_data_files(cls, files):
+        """
+        Select the COP data files among files, with a single COP data file per trial, i.e the file in the configured COP
+        data format if it exists, or else the file in the other format, so that the features of a trial are computed once.
+        """
+
+        cop_data_files = {}
+        for file in files:
+            extension = next((extension for extension in cls.cop_data_extensions if file.endswith(extension)), None)
+            if extension is None:
+                continue
+
+            trial = file[:-len(extension)]
+            if trial not in cop_data_files or extension == cls.cop_data_extension:
+                cop_data_files[trial] = file
+
+        return list(cop_data_files.values())
+
     def set_pipeline_cop_data(self, files):
         """Set the input cop data of the pipeline."""
 
@@ -74,22 +339,4 @@ class FeatureExtractionPipeline(HybridAcquisitionReader, DataProcessor):
     def parse_filepath(file):
         """Parse the filepath to retrieve information that allows to identify the acquisition"""
 
-        FP = "FP"
-        WBB = "BB"
-        keys = ["device", "subject", "trial", "balance board"]
-        trial_info = dict.fromkeys(keys)
-        trial_info["device"] = FP if FP in file else WBB
-
-        pre_subject_substring = "Repro"
-        pre_subject_substring_index = file.find(pre_subject_substring)
-        trial_info["subject"] = file[pre_subject_substring_index + len(pre_subject_substring)]
-
-        pre_balance_board_substring = trial_info["device"] + "/"
-        pre_balance_board_substring_index = file.find(pre_balance_board_substring)
-        trial_info["balance board"] = file[pre_balance_board_substring_index + len(pre_balance_board_substring)]
-
-        pre_trial_substring = pre_balance_board_substring + trial_info["balance board"] + "_"
-        pre_trial_substring_index = file.find(pre_trial_substring)
-        trial_info["trial"] = file[pre_trial_substring_index + len(pre_trial_substring)]
-
-        return trial_info
+        return parse_trial_info(file)
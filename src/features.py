@@ -1,9 +1,10 @@
 # Built-in modules imports
-from utils import load_config
+from utils import load_config, load_npz
 
 # Third-party module imports
 import numpy as np
 import json
+import os
 
 config = load_config()
 
@@ -26,14 +27,22 @@ class CopFeatures:
         self.T = self.N / self.acquisition_frequency
 
     @classmethod
-    def from_file(cls, filepath):
-        cop_x, cop_y = cls.parse_cop_data(filepath)
+    def from_file(cls, filepath, mmap_mode=None):
+        cop_x, cop_y = cls.parse_cop_data(filepath, mmap_mode)
 
         return cls(cop_x, cop_y)
 
     @staticmethod
-    def parse_cop_data(filepath):
-        """Parse cop data from an input file."""
+    def parse_cop_data(filepath, mmap_mode=None):
+        """
+        Parse cop data from an input file, in npz or json format according to its extension. The COP data of a npz file is
+        memory mapped if a memory mapping mode is given.
+        """
+
+        if os.path.splitext(filepath)[1] == ".npz":
+            cop_data = load_npz(filepath, mmap_mode)
+
+            return cop_data["COP_x"], cop_data["COP_y"]
 
         with open(filepath) as json_data:
             cop_data = json.load(json_data)
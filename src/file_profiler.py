@@ -0,0 +1,104 @@
+# Built-in modules imports
+from contextlib import contextmanager, nullcontext
+from utils import load_config, check_folder
+import cProfile
+import fnmatch
+import os
+import pstats
+
+# Third-party module imports
+import logging
+
+logger = logging.getLogger("pipeline")
+
+config = load_config()
+
+
+class FileProfiler:
+    """
+    Profiler of the processing of selected files of a pipeline.
+
+    The files are selected either by a glob pattern matched against their paths, or as the N slowest files of a run
+    according to the records of its stage timer, which are then processed again. The processing of every selected file
+    is profiled with cProfile, and its profile is dumped to a .prof file in the profile folder, along with a text summary
+    of the functions with the highest cumulative times. The profiles are kept apart from the outputs of the pipelines, so
+    that they are never read as inputs of the next pipelines.
+
+    The selector is either the glob pattern or the number of slowest files. No file is selected without a selector.
+    """
+
+    top_functions_number = 30
+
+    profile_folder = config["profile_folder"]
+
+    def __init__(self, selector=None):
+        self.pattern = None
+        self.slowest_files_number = 0
+        self.selected_files = set()
+
+        if selector is not None and selector.isdigit():
+            self.slowest_files_number = int(selector)
+        else:
+            self.pattern = selector
+
+    def is_selected(self, filepath):
+        return filepath in self.selected_files or (self.pattern is not None and fnmatch.fnmatch(filepath, self.pattern))
+
+    def select_files(self, filepaths):
+        """Select the files matching the glob pattern, or all the files if the profiler has no pattern."""
+
+        if self.pattern is None:
+            return filepaths
+
+        return [filepath for filepath in filepaths if self.is_selected(filepath)]
+
+    def select_slowest_files(self, records):
+        """Select the slowest processed files from the stage timer records of a run, which are then profiled."""
+
+        records = sorted(records, key=lambda record: record["total"], reverse=True)
+        slowest_files = [record["filepath"] for record in records[:self.slowest_files_number]]
+        self.selected_files.update(slowest_files)
+
+        return slowest_files
+
+    def profile(self, filepath, output_filepath):
+        """Get the context in which the processing of a file is profiled if it is selected."""
+
+        if not self.is_selected(filepath):
+            return nullcontext()
+
+        return self.profile_file(output_filepath)
+
+    @contextmanager
+    def profile_file(self, output_filepath):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self.save_profile(profiler, output_filepath)
+
+    def build_profile_filepath(self, output_filepath):
+        """
+        Build the path of the profile of the processing of a file, without its extension, after the path of the output of
+        the file relative to the results folder which contains the profile folder.
+        """
+
+        profile_folder = os.path.abspath(self.profile_folder)
+        output_base_name = os.path.splitext(os.path.abspath(output_filepath))[0]
+        results_folder = os.path.commonpath([os.path.dirname(profile_folder), output_base_name])
+
+        return os.path.join(profile_folder, os.path.relpath(output_base_name, results_folder))
+
+    def save_profile(self, profiler, output_filepath):
+        """Save the profile of the processing of a file, and its summary, in the profile folder."""
+
+        base_name = self.build_profile_filepath(output_filepath)
+        check_folder(os.path.dirname(base_name))
+
+        profiler.dump_stats(base_name + ".prof")
+        with open(base_name + "_profile.txt", "w") as summary_file:
+            pstats.Stats(profiler, stream=summary_file).sort_stats("cumulative").print_stats(self.top_functions_number)
+
+        logger.info("Profile saved to: {}".format(base_name + ".prof"))
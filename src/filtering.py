@@ -0,0 +1,39 @@
+# Third-party module imports
+import scipy.signal
+
+
+class ButterworthFilterBank:
+    """
+    Class that caches the designs of low pass butterworth filters and applies them to multichannel signals.
+
+    The filters are designed in second-order sections form, which is numerically more stable than the transfer function
+    (b, a) form at higher orders, and the designs are cached by (order, cutoff frequency, sampling frequency) so that
+    they are computed only once.
+
+    References
+    ----------
+    .. [1] Scipy documentation: https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.butter.html
+    .. [2] Scipy documentation: https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.sosfiltfilt.html
+    """
+
+    designs = {}
+
+    @classmethod
+    def get_design(cls, order, fc, fs):
+        """Get the second-order sections of a low pass butterworth filter, designing it if it is not cached yet."""
+
+        key = (order, fc, fs)
+        if key not in cls.designs:
+            cls.designs[key] = scipy.signal.butter(order, fc / (0.5 * fs), output="sos")
+
+        return cls.designs[key]
+
+    @classmethod
+    def apply(cls, input_signal, order, fc, fs, axis=0):
+        """
+        Apply a low pass butterworth filter forward and backward to the input signal.
+
+        A 2-d (samples x channels) input signal is filtered in a single pass along the given axis.
+        """
+
+        return scipy.signal.sosfiltfilt(cls.get_design(order, fc, fs), input_signal, axis=axis)
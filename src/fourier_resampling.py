@@ -0,0 +1,83 @@
+# Third-party module imports
+import logging
+
+import numpy as np
+import scipy.fft
+import scipy.signal
+
+logger = logging.getLogger("pipeline")
+
+
+class PairedFourierResampler:
+    """
+    Class that resamples multichannel signals using the Fourier method with paired complex FFTs.
+
+    The output is the same as the one of scipy.signal.resample. The real channels are packed by pairs into complex
+    signals, i.e x1 + 1j * x2, whose spectrums are resampled like the ones of complex signals: since the resampling is
+    linear, the real and imaginary parts of the resampled signals are the two resampled channels. Each pair of channels
+    then costs a single complex FFT, instead of one real FFT per channel, which makes the difference when the number of
+    samples is not a fast FFT size (e.g. a large prime number of samples) and the FFT falls back on Bluestein's algorithm.
+    The FFTs are computed at the numbers of input and output samples, without any zero-padding, which would change the
+    resampled signal.
+
+    The signals whose number of samples is a fast FFT size, and the single channel signals, are resampled with
+    scipy.signal.resample, which is faster for them.
+
+    References
+    ----------
+    .. [1] Scipy documentation: https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.resample.html
+    """
+
+    @classmethod
+    def resample(cls, input_signal, num):
+        """Resample a 1-d signal or every channel of a 2-d (samples x channels) signal to num samples along the first axis."""
+
+        num = int(num)
+        a_signal = np.asarray(input_signal, dtype=float)
+        flat_signal = a_signal.reshape(a_signal.shape[0], -1)
+        Nx, number_of_channels = flat_signal.shape
+
+        if number_of_channels < 2 or scipy.fft.next_fast_len(Nx, real=True) == Nx:
+            logger.debug("Fourier resampling from {} to {} samples with real FFTs".format(Nx, num))
+            return scipy.signal.resample(a_signal, num, axis=0)
+
+        # Pack the channels by pairs, the imaginary part of the last pair being zero for an odd number of channels
+        number_of_pairs = (number_of_channels + 1) // 2
+        packed_signal = np.zeros((Nx, number_of_pairs), dtype=complex)
+        packed_signal.real = flat_signal[:, 0::2]
+        packed_signal.imag[:, :number_of_channels // 2] = flat_signal[:, 1::2]
+        logger.debug("Fourier resampling from {} to {} samples with {} paired complex FFTs".format(Nx, num,
+                                                                                                  number_of_pairs))
+
+        spectrum = scipy.fft.fft(packed_signal, axis=0, overwrite_x=True)
+        resampled_spectrum = cls.resample_spectrum(spectrum, Nx, num)
+        packed_resampled_signal = scipy.fft.ifft(resampled_spectrum, axis=0, overwrite_x=True) * (float(num) / float(Nx))
+
+        resampled_signal = np.empty((num, 2 * number_of_pairs))
+        resampled_signal[:, 0::2] = packed_resampled_signal.real
+        resampled_signal[:, 1::2] = packed_resampled_signal.imag
+
+        return resampled_signal[:, :number_of_channels].reshape((num,) + a_signal.shape[1:])
+
+    @staticmethod
+    def resample_spectrum(spectrum, Nx, num):
+        """Crop or zero-pad the spectrum of complex signals of Nx samples to num samples, like scipy.signal.resample."""
+
+        resampled_spectrum = np.zeros((num,) + spectrum.shape[1:], dtype=complex)
+
+        # Positive and negative frequency components kept in the output spectrum
+        N = min(num, Nx)
+        nyq = N // 2 + 1
+        resampled_spectrum[:nyq] = spectrum[:nyq]
+        if N > 2:
+            resampled_spectrum[nyq - N:] = spectrum[nyq - N:]
+
+        # Split/join the Nyquist components if present
+        if N % 2 == 0:
+            if num < Nx:
+                resampled_spectrum[N // 2] += spectrum[-(N // 2)]
+            elif Nx < num:
+                resampled_spectrum[N // 2] *= 0.5
+                resampled_spectrum[num - N // 2] = resampled_spectrum[N // 2]
+
+        return resampled_spectrum
@@ -4,19 +4,100 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../bin')))
 
 # Built-in modules imports
-from btk import btkAcquisitionFileReader, btkAcquisition
-from utils import load_config
+from c3d_reader import C3DAcquisition
+from channel_matrix import ChannelMatrix
+from raw_data_cache import RawDataCache
+from stage_timer import StageTimer, timed_stage
+from utils import load_config, check_folder
+from collections import OrderedDict
 from datetime import datetime
+import numpy as np
+import pandas as pd
 
 config = load_config()
 
+try:
+    from btk import btkAcquisitionFileReader, btkAcquisition
+except ImportError:
+    # The numpy reader backend does not need the compiled biomechanical toolkit binaries
+    if config["reader_parameters"]["backend"] != "numpy":
+        raise
+    btkAcquisitionFileReader = object
+
+
+class AcquisitionHandle:
+    """
+    Acquisition file parsed once, which serves the acquisition frequencies, duration, labels and channel data from that
+    single parse.
+    """
+
+    def __init__(self, filepath, acquisition):
+        self.filepath = filepath
+        self.acquisition = acquisition
+
+        self.analog_frequency = acquisition.GetAnalogFrequency()
+        self.point_frequency = acquisition.GetPointFrequency()
+        self.duration = acquisition.GetDuration()
+        self.analog_labels = [acquisition.GetAnalog(i).GetLabel() for i in range(acquisition.GetAnalogNumber())]
+        self.point_labels = [acquisition.GetPoint(i).GetLabel() for i in range(acquisition.GetPointNumber())]
+
+    def get_frequency(self, point=False):
+        return self.point_frequency if point else self.analog_frequency
+
+    def get_analog_data(self, labels, as_matrix=False):
+        return HybridAcquisitionReader.get_analog_data(self.acquisition, labels, as_matrix)
+
+    def get_point_data(self, labels, as_matrix=False):
+        return HybridAcquisitionReader.get_point_data(self.acquisition, labels, as_matrix)
+
+
+class AcquisitionCache:
+    """
+    Least recently used cache of the acquisition handles of the recently opened files.
+
+    The handles are keyed by file path and modification time, so that a modified file is parsed again.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.handles = OrderedDict()
+
+    @staticmethod
+    def compute_key(filepath):
+        return os.path.abspath(filepath), os.stat(filepath).st_mtime_ns
+
+    def get(self, filepath, open_handle):
+        """Get the handle of an acquisition file, which is opened with the given function if it is not cached."""
+
+        key = self.compute_key(filepath)
+        if key in self.handles:
+            self.handles.move_to_end(key)
+            return self.handles[key]
+
+        handle = open_handle(filepath)
+
+        # The handles of the previous versions of a modified file are outdated
+        for outdated_key in [cached_key for cached_key in self.handles if cached_key[0] == key[0]]:
+            del self.handles[outdated_key]
+
+        if self.max_size > 0:
+            self.handles[key] = handle
+            while len(self.handles) > self.max_size:
+                self.handles.popitem(last=False)
+
+        return handle
+
+    def clear(self):
+        self.handles.clear()
+
 
 class HybridAcquisitionReader(btkAcquisitionFileReader):
     """
     Class used to extract the raw sensor data values from the WBB and force plate acquisition files which are stored in the c3d file format.
 
     The locally compiled and installed binaries of the biomechanical toolkit python wrapper are used to read
-    and extract the data.
+    and extract the data. Alternatively, the "numpy" reader backend memory maps the acquisition files and extracts the
+    channels as views of the file data, without the biomechanical toolkit (see c3d_reader.C3DAcquisition).
 
     Notes
     -----
@@ -28,6 +109,17 @@ class HybridAcquisitionReader(btkAcquisitionFileReader):
     wbb_data_points_labels = config["wbb_labels"]["data_points_labels"]
     wbb_analog_labels = config["wbb_labels"]["analog_labels"]
     force_plate_analog_labels = config["force_plate_labels"]["analog_labels"]
+    backend = config["reader_parameters"]["backend"]
+    manifest_columns = ["filepath", "device", "file_size", "analog_frequency", "point_frequency", "analog_samples",
+                        "point_samples", "duration", "truncated", "valid", "error"]
+    acquisition_cache = AcquisitionCache(config["reader_parameters"]["cache_size"])
+    channel_matrix = config["reader_parameters"]["channel_matrix"]
+    use_raw_data_cache = config["reader_parameters"]["raw_data_cache"]
+    raw_data_cache = RawDataCache(config["reader_parameters"]["raw_data_cache_folder"],
+                                  config["reader_parameters"]["raw_data_cache_max_size_mb"] * 2 ** 20)
+
+    # Timer of the reading stages, disabled unless the pipeline enables it
+    stage_timer = StageTimer()
 
     def __init__(self):
         super(HybridAcquisitionReader, self).__init__()
@@ -38,8 +130,35 @@ class HybridAcquisitionReader(btkAcquisitionFileReader):
         self.SetFilename(filepath)
         self.Update()
 
+    def read_acquisition(self, filepath):
+        """Read an acquisition file with the reader backend chosen in the configuration file."""
+
+        if self.backend == "numpy":
+            return C3DAcquisition(filepath)
+
+        self.set_reader_filename(filepath)
+
+        # The reader output is updated in place by the next file read, a copy is kept instead
+        return self.GetOutput().Clone()
+
+    @timed_stage("read acquisition")
+    def open_acquisition(self, filepath):
+        """Get the handle of an acquisition file, which is only parsed if it is not in the acquisition cache."""
+
+        return self.acquisition_cache.get(filepath, lambda path: AcquisitionHandle(path, self.read_acquisition(path)))
+
     @staticmethod
-    def get_point_data(acquisition, labels):
+    def get_point_data(acquisition, labels, as_matrix=False):
+        """
+        Extract the coordinates of the points, as a dictionary of (frames x 3) arrays or as a single (frames x 3 * points)
+        channel matrix which is filled directly from the acquisition.
+        """
+
+        if as_matrix:
+            read_point = getattr(acquisition, "read_point",
+                                 lambda label, out: np.copyto(out, acquisition.GetPoint(label).GetValues()))
+            return ChannelMatrix.from_channels(labels, 3, acquisition.GetPointFrameNumber(), read_point)
+
         try:
             points = [acquisition.GetPoint(label) for label in labels]
             values = [point.GetValues() for point in points]
@@ -49,7 +168,17 @@ class HybridAcquisitionReader(btkAcquisitionFileReader):
         return dict(zip(labels, values))
 
     @staticmethod
-    def get_analog_data(acquisition, labels):
+    def get_analog_data(acquisition, labels, as_matrix=False):
+        """
+        Extract the values of the analog channels, as a dictionary of (samples x 1) arrays or as a single (samples x
+        channels) channel matrix which is filled directly from the acquisition.
+        """
+
+        if as_matrix:
+            read_analog = getattr(acquisition, "read_analog",
+                                  lambda label, out: np.copyto(out, acquisition.GetAnalog(label).GetValues()))
+            return ChannelMatrix.from_channels(labels, 1, acquisition.GetAnalogFrameNumber(), read_analog)
+
         try:
             points = [acquisition.GetAnalog(label) for label in labels]
             values = [point.GetValues() for point in points]
@@ -60,7 +189,44 @@ class HybridAcquisitionReader(btkAcquisitionFileReader):
 
     @staticmethod
     def compute_timestamps(time_dict):
-        """ Reformat the acquisition timestamps from absolute dates to relative timestamps in seconds. """
+        """
+        Reformat the acquisition timestamps from absolute dates to relative timestamps in seconds.
+
+        The dates are decoded with numpy datetime64 and integer arithmetic: they are converted to integer microseconds, and
+        the durations between consecutive dates are accumulated in the same order as with python datetime objects, which
+        gives the exact same float64 timestamps.
+        """
+
+        try:
+            year, month, day, hour, minute, second, milisecond = (
+                np.rint(time_dict[key].flatten()).astype(np.int64) for key in time_dict.keys())
+
+            # Calendar dates, month and day rollovers being handled by datetime64 arithmetic
+            months = (year - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (month - 1)
+            days = months.astype("datetime64[D]") + (day - 1)
+
+            invalid_dates = (month < 1) | (month > 12) | (day < 1) | (days.astype("datetime64[M]") != months) | \
+                (hour < 0) | (hour > 23) | (minute < 0) | (minute > 59) | (second < 0) | (second > 61) | \
+                (milisecond < 0) | (milisecond > 999)
+            if np.any(invalid_dates):
+                raise ValueError("Invalid acquisition date at sample {}".format(np.flatnonzero(invalid_dates)[0]))
+
+            microseconds = days.astype("datetime64[us]").astype(np.int64) + \
+                ((hour * 60 + minute) * 60 + second) * 10 ** 6 + milisecond * 10 ** 3
+
+            timestamps_seconds = np.zeros(microseconds.size)
+            timestamps_seconds[1:] = np.cumsum(np.diff(microseconds) / 10 ** 6)
+        except RuntimeError:
+            raise
+
+        return timestamps_seconds
+
+    @staticmethod
+    def compute_timestamps_strptime(time_dict):
+        """
+        Reformat the acquisition timestamps from absolute dates to relative timestamps in seconds, by parsing every date
+        string with python datetime (reference implementation of compute_timestamps).
+        """
 
         try:
             time_strings_lists = []
@@ -94,35 +260,100 @@ class HybridAcquisitionReader(btkAcquisitionFileReader):
         """
         Extract and aggregate raw sensor data from the c3d acquisition file.
 
-        The choice of data which is extracted can be modified through the configuration file.
+        The choice of data which is extracted can be modified through the configuration file. If the raw data cache is
+        enabled, the raw data is read from the cache, and only extracted from the acquisition file if it is not cached.
         """
 
-        self.set_reader_filename(filepath)
-        acq = self.GetOutput()
+        if not self.use_raw_data_cache:
+            return self.read_raw_data(filepath, balance_board)
+
+        if balance_board:
+            labels = self.wbb_data_points_labels
+            key_labels = self.wbb_analog_labels + self.wbb_data_points_labels
+        else:
+            labels = key_labels = self.force_plate_analog_labels
+
+        with self.stage_timer.stage("raw data cache"):
+            return self.raw_data_cache.get(filepath, lambda: self.read_raw_data(filepath, balance_board), labels,
+                                           key_labels, balance_board, self.channel_matrix, self.backend)
+
+    @timed_stage("read channels")
+    def read_raw_data(self, filepath, balance_board=False):
+        """Extract and aggregate raw sensor data from the c3d acquisition file."""
+
+        acquisition = self.open_acquisition(filepath)
 
         if balance_board:
             analog_labels = self.wbb_analog_labels
             data_points_labels = self.wbb_data_points_labels
 
-            analog_data = self.get_analog_data(acq, analog_labels)
-            relative_timestamps = self.compute_timestamps(analog_data)
-            point_data = self.get_point_data(acq, data_points_labels)
+            analog_data = acquisition.get_analog_data(analog_labels, self.channel_matrix)
+            with self.stage_timer.stage("compute timestamps"):
+                relative_timestamps = self.compute_timestamps(analog_data)
+            point_data = acquisition.get_point_data(data_points_labels, self.channel_matrix)
 
             return [relative_timestamps, point_data]
 
         else:
             analog_labels = self.force_plate_analog_labels
-            analog_data = self.get_analog_data(acq, analog_labels)
+            analog_data = acquisition.get_analog_data(analog_labels, self.channel_matrix)
 
             return analog_data
 
+    def scan_acquisition_header(self, filepath):
+        """
+        Summarize the content of an acquisition file from its header and parameter section only.
+
+        The header is parsed by the NumPy C3D parser whatever the reader backend, and the data section is never read. The
+        files which cannot be opened or parsed, are truncated or lack some of the configured labels are flagged as invalid.
+        """
+
+        balance_board = "FP" not in filepath
+        labels = self.wbb_analog_labels + self.wbb_data_points_labels if balance_board else self.force_plate_analog_labels
+        summary = {"filepath": filepath, "device": "Wii Balance Board" if balance_board else "Force plate"}
+
+        try:
+            summary["file_size"] = os.path.getsize(filepath)
+            acquisition = C3DAcquisition(filepath)
+        except (OSError, RuntimeError, ValueError, IndexError) as err:
+            return {**summary, "valid": False, "error": str(err)}
+
+        missing_labels = [label for label in labels if label not in acquisition.analog_labels + acquisition.point_labels]
+        truncated = acquisition.is_truncated()
+        errors = (["truncated file"] if truncated else []) + \
+            (["missing labels: {}".format(", ".join(missing_labels))] if missing_labels else [])
+
+        return {**summary,
+                "analog_frequency": acquisition.GetAnalogFrequency(),
+                "point_frequency": acquisition.GetPointFrequency(),
+                "analog_samples": acquisition.GetAnalogFrameNumber(),
+                "point_samples": acquisition.GetPointFrameNumber(),
+                "duration": acquisition.GetDuration(),
+                "truncated": truncated,
+                "valid": not errors,
+                "error": "; ".join(errors)}
+
+    def scan_acquisition_headers(self, filepaths, manifest_path=None):
+        """
+        Scan the headers of several acquisition files and gather their summaries into a manifest, sorted by decreasing
+        number of samples, which is saved to a csv or parquet file if a path is given.
+        """
+
+        manifest = pd.DataFrame([self.scan_acquisition_header(filepath) for filepath in filepaths],
+                                columns=self.manifest_columns)
+        manifest = manifest.sort_values("analog_samples", ascending=False, na_position="last", kind="stable")
+        manifest = manifest.reset_index(drop=True)
+
+        if manifest_path is not None:
+            check_folder(os.path.dirname(manifest_path))
+            if manifest_path.endswith(".parquet"):
+                manifest.to_parquet(manifest_path, index=False)
+            else:
+                manifest.to_csv(manifest_path, index=False)
+
+        return manifest
+
     def get_frequency(self, filepath, point=False):
         """Extract analog/point frequencies."""
 
-        self.set_reader_filename(filepath)
-        acq = self.GetOutput()
-
-        if point:
-            return acq.GetPointFrequency()
-        else:
-            return acq.GetAnalogFrequency()
+        return self.open_acquisition(filepath).get_frequency(point)
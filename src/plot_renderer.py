@@ -0,0 +1,203 @@
+# Built-in modules imports
+from utils import load_config, setup_logging, compute_rd, plot_stabilograms, plot_spectral_densities, \
+    build_stabilograms_filename, build_spectral_densities_filename
+import multiprocessing
+import queue
+import warnings
+
+# Third-party module imports
+import logging
+import numpy as np
+from matplotlib import pyplot as plt, gridspec
+
+logger = logging.getLogger("pipeline")
+
+config = load_config()
+
+
+class StabilogramsFigure:
+    """Stabilograms figure of the background renderer, whose figure, axes and lines are reused for every plot."""
+
+    def __init__(self):
+        self.fig, axs = plt.subplots(2, 2, figsize=(15, 10))
+        self.axs = axs.ravel()
+
+        labels = [("Time (s)", "ML distance (mm)"), ("Time (s)", "AP distance (mm)"),
+                  ("Time (s)", "Resultant distance (mm)"), ("ML distance (mm)", "AP distance (mm)")]
+        self.lines = []
+        for ax, (x_label, y_label) in zip(self.axs, labels):
+            self.lines.append(ax.plot([], [])[0])
+            ax.set_xlabel(x_label)
+            ax.set_ylabel(y_label)
+            ax.grid(linewidth=0.5, linestyle="--")
+
+    def draw(self, cop_x, cop_y, acq_frequency):
+        index = np.arange(len(cop_x)) / acq_frequency
+        cop_rd = compute_rd(cop_x, cop_y)
+
+        for ax, line, (x, y) in zip(self.axs, self.lines, [(index, cop_x), (index, cop_y), (index, cop_rd),
+                                                           (cop_x, cop_y)]):
+            line.set_data(x, y)
+            ax.relim()
+            ax.autoscale_view()
+
+
+class SpectralDensitiesFigure:
+    """Spectral densities figure of the background renderer, whose figure, axes and lines are reused for every plot."""
+
+    def __init__(self):
+        gs = gridspec.GridSpec(2, 2)
+        self.fig = plt.figure(figsize=(15, 10))
+        self.axs = [self.fig.add_subplot(gs[0, 0]), self.fig.add_subplot(gs[0, 1]), self.fig.add_subplot(gs[1, :])]
+
+        y_labels = ["Power spectral density in ML direction [mm**2/Hz]",
+                    "Power spectral density in AP direction [mm**2/Hz]",
+                    "Resultant distance power spectral density[mm**2/Hz]"]
+        self.lines = []
+        for ax, y_label in zip(self.axs, y_labels):
+            self.lines.append(ax.plot([], [])[0])
+            ax.set_xlabel("Frequency [Hz]")
+            ax.set_ylabel(y_label)
+            ax.set_yscale("log")
+            ax.grid(linewidth=0.5, linestyle="--")
+
+    def draw(self, frequencies, spectrums):
+        for ax, line, frequency, spectrum in zip(self.axs, self.lines, frequencies, spectrums):
+            line.set_data(frequency, spectrum)
+            ax.relim()
+            ax.autoscale_view()
+
+
+def render_plots(plot_queue):
+    """
+    Render the plots received from the queue of the background renderer until the end of the queue, with the Agg backend
+    and a single figure per type of plot.
+    """
+
+    # The logging configuration is not inherited by the rendering process when it is spawned instead of forked
+    if not logger.handlers:
+        setup_logging()
+
+    plt.switch_backend("Agg")
+
+    # The warnings are not turned into errors like in the preprocessing, so that a plot is never lost because of them
+    warnings.simplefilter("default")
+
+    figures = {"stabilograms": StabilogramsFigure(), "spectral_densities": SpectralDensitiesFigure()}
+
+    for plot_type, arrays, fig_name in iter(plot_queue.get, None):
+        try:
+            figure = figures[plot_type]
+            figure.draw(*arrays)
+            figure.fig.savefig(fig_name, bbox_inches='tight')
+        except Exception as err:
+            logger.error(": {} \n Problem with plot:{}".format(err, fig_name), exc_info=True)
+
+    for figure in figures.values():
+        plt.close(figure.fig)
+
+
+class PlotRenderer:
+    """
+    Renderer of the stabilograms and spectral densities plots of the pipelines.
+
+    In the inline mode, the plots are rendered by the process which computes them. In the background mode, the arrays to
+    draw are sent to the queue of a separate rendering process, so that the pipelines throughput only depends on the
+    computations, and the rendering errors are logged by the rendering process instead of failing the files. No plot is
+    rendered in the none mode.
+
+    The renderer can be passed to the worker processes of the pipelines, which then send their plots to the same rendering
+    process. The process which created the renderer closes it to wait for all the plots to be rendered.
+
+    A plot which cannot be sent to the rendering process, because it is not running anymore or because its queue stays
+    full for the put timeout, is rendered inline, and so are the next plots of the process which sent it, so that the
+    pipelines never hang on a dead rendering process.
+    """
+
+    modes = ["inline", "background", "none"]
+
+    queue_size = config["plot_parameters"]["background_queue_size"]
+    put_timeout = config["plot_parameters"]["background_put_timeout"]
+
+    def __init__(self, mode="inline"):
+        if mode not in self.modes:
+            raise ValueError("Unknown plot rendering mode: {}".format(mode))
+
+        self.mode = mode
+        self.plot_queue = None
+        self.process = None
+
+        if mode == "background":
+            self.plot_queue = multiprocessing.Queue(self.queue_size)
+            self.process = multiprocessing.Process(target=render_plots, args=(self.plot_queue,), daemon=True)
+            self.process.start()
+
+    def __getstate__(self):
+        # The worker processes only share the queue of the rendering process
+        state = self.__dict__.copy()
+        state["process"] = None
+
+        return state
+
+    def plot_stabilograms(self, preprocessed_cop_data, device_name, acq_frequency, filepath):
+        if self.mode == "inline":
+            plot_stabilograms(preprocessed_cop_data, device_name, acq_frequency, filepath=filepath)
+        elif self.mode == "background":
+            arrays = (np.asarray(preprocessed_cop_data["COP_x"]), np.asarray(preprocessed_cop_data["COP_y"]),
+                      acq_frequency)
+            if not self.send_plot(("stabilograms", arrays, build_stabilograms_filename(filepath))):
+                plot_stabilograms(preprocessed_cop_data, device_name, acq_frequency, filepath=filepath)
+
+    def plot_spectral_densities(self, frequencies, spectrums, filepath):
+        if self.mode == "inline":
+            plot_spectral_densities(frequencies, spectrums, filepath=filepath)
+        elif self.mode == "background":
+            arrays = ([np.asarray(frequency) for frequency in frequencies],
+                      [np.asarray(spectrum) for spectrum in spectrums])
+            if not self.send_plot(("spectral_densities", arrays, build_spectral_densities_filename(filepath))):
+                plot_spectral_densities(frequencies, spectrums, filepath=filepath)
+
+    def is_rendering_process_alive(self):
+        # Only the process which created the renderer can check its rendering process, the others rely on the put timeout
+        return self.process is None or self.process.is_alive()
+
+    def send_plot(self, plot):
+        """
+        Send a plot to the rendering process, and return whether it was sent. If it was not, the renderer falls back to
+        the inline mode.
+        """
+
+        sent = False
+        if self.is_rendering_process_alive():
+            try:
+                self.plot_queue.put(plot, timeout=self.put_timeout)
+                sent = self.is_rendering_process_alive()
+            except queue.Full:
+                pass
+
+        if not sent:
+            logger.error("The background rendering process is not receiving the plots, falling back to inline plotting")
+            self.mode = "inline"
+            # The plots left in the queue must not keep the process from exiting
+            self.plot_queue.cancel_join_thread()
+
+        return sent
+
+    def close(self):
+        """Wait for the rendering process to render all the queued plots, and stop it."""
+
+        if self.process is not None:
+            # The end of the queue is sent for as long as the rendering process is alive to receive it
+            while self.process.is_alive():
+                try:
+                    self.plot_queue.put(None, timeout=self.put_timeout)
+                    break
+                except queue.Full:
+                    pass
+            self.process.join()
+
+            if self.process.exitcode != 0:
+                logger.error("The background rendering process exited with code {}, the plots queued before it exited "
+                             "may not have been rendered".format(self.process.exitcode))
+                self.plot_queue.cancel_join_thread()
+            self.process = None
@@ -1,8 +1,16 @@
 # Built-in modules imports
 from hybrid_reader import HybridAcquisitionReader
+from cop_data_store import CopDataStore
 from preprocessor import DataPreprocessor
-from utils import save_as_json, plot_stabilograms
+from processing_manifest import ProcessingManifest
+from plot_renderer import PlotRenderer
+from stage_timer import StageTimer
+from file_profiler import FileProfiler
+from utils import load_config, save_as_json, save_as_npz, build_filepath
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import traceback
 import sys
 
 # Third-party module imports
@@ -10,55 +18,233 @@ import logging
 
 logger = logging.getLogger("pipeline")
 
+config = load_config()
+
+# Pipeline object of the current worker process, when the files are preprocessed in parallel
+worker_pipeline = None
+
+
+def initialize_worker(pipeline_class, pipeline_arguments):
+    """Create the pipeline object, i.e the acquisition reader and the data preprocessor, of a worker process."""
+
+    global worker_pipeline
+    worker_pipeline = pipeline_class(**pipeline_arguments)
+
+
+def preprocess_acquisition_file_in_worker(filepath, balance_board=False):
+    """
+    Preprocess an acquisition file in a worker process, and return the error message if the preprocessing failed, along
+    with the stages timing record of the file.
+    """
+
+    try:
+        with worker_pipeline.stage_timer.file(filepath), \
+                worker_pipeline.file_profiler.profile(filepath, worker_pipeline.build_output_filepath(filepath)):
+            worker_pipeline.run_acquisition_file_preprocessing(filepath, balance_board)
+    except Exception as err:
+        return filepath, "{} \n{}".format(err, traceback.format_exc()), worker_pipeline.stage_timer.pop_record()
+
+    return filepath, None, worker_pipeline.stage_timer.pop_record()
+
 
 class PreprocessingPipeline(HybridAcquisitionReader, DataPreprocessor):
     """
     Class that pipelines all the different data processing steps from acquisition file reading to feature extraction.
     """
 
-    def __init__(self, acquisition_files=None):
+    processing_manifest_file = config["processing_manifest_file"]
+
+    # Format of the preprocessed COP data, i.e npz (binary) or json files, or a study level COP data store
+    cop_data_format = config["cop_data_format"]
+    cop_data_extension = "_cop.{}".format(cop_data_format)
+    cop_data_store = CopDataStore(config["cop_data_store_folder"])
+
+    # Configuration sections which the outputs depend on, for the incremental processing
+    output_config_sections = ["force_plate_labels", "wbb_labels", "force_plate_parameters", "preprocessing_parameters"]
+
+    # Source modules which the outputs depend on, i.e the readers, the preprocessing and the saving of the COP data
+    output_modules = ["c3d_reader", "channel_matrix", "hybrid_reader", "preprocessor", "resampling", "fourier_resampling",
+                      "filtering", "preprocessing_pipeline"]
+
+    def __init__(self, acquisition_files=None, plot_renderer=None, stage_timer=None, file_profiler=None):
         super(PreprocessingPipeline, self).__init__()
         self.acquisition_data = acquisition_files
+        self.plot_renderer = plot_renderer if plot_renderer is not None else PlotRenderer()
+        self.file_profiler = file_profiler if file_profiler is not None else FileProfiler()
+        if stage_timer is not None:
+            self.stage_timer = stage_timer
 
     def preprocess_acquisition_file(self, filepath, balance_board=False):
         """
-        Pipeline the raw acquisition file reading, COP computations and preprocessing steps and save the results to a json file."""
+        Pipeline the raw acquisition file reading, COP computations and preprocessing steps and save the results to a json file.
+
+        Returns whether the preprocessing succeeded.
+        """
 
         try:
-            # Get the raw data
-            raw_data = self.get_raw_data(filepath, balance_board)
+            with self.stage_timer.file(filepath), \
+                    self.file_profiler.profile(filepath, self.build_output_filepath(filepath)):
+                self.run_acquisition_file_preprocessing(filepath, balance_board)
+
+        except Exception as err:
+            logger.error(": {} \n Problem with file:{}".format(err, filepath), exc_info=True, stack_info=True)
+            return False
 
-            # Preprocess the raw data
-            preprocessed_cop_data = self.preprocess_raw_data(raw_data, balance_board)
+        return True
 
-            if balance_board:
-                device_name = "Wii Balance Board"
-            else:
-                device_name = "Force plate"
+    def run_acquisition_file_preprocessing(self, filepath, balance_board=False):
+        """Run the preprocessing steps of an acquisition file, without handling the errors."""
+
+        preprocessed_cop_data = self.preprocess_acquisition(filepath, balance_board)
+
+        # Save results of COP signal computations and preprocessing
+        with self.stage_timer.stage("save cop data"):
+            self.save_preprocessed_cop_data(preprocessed_cop_data, filepath)
+
+        # Plot and save the stabilograms
+        with self.stage_timer.stage("plot stabilograms"):
+            self.plot_preprocessed_cop_data(preprocessed_cop_data, filepath, balance_board)
+
+    def preprocess_acquisition(self, filepath, balance_board=False):
+        """Read the raw data of an acquisition file and compute the preprocessed COP data."""
+
+        # Get the raw data
+        raw_data = self.get_raw_data(filepath, balance_board)
+
+        # Preprocess the raw data
+        return self.preprocess_raw_data(raw_data, balance_board)
+
+    @classmethod
+    def save_preprocessed_cop_data(cls, preprocessed_cop_data, filepath):
+        """
+        Save the preprocessed COP data in the COP data format, with its sampling frequency in npz format or in the COP data
+        store, where it is identified by the path of its COP data file.
+        """
 
-            # Save results of COP signal computations and preprocessing
-            logger.debug("Saving COP preprocessed data to file: {}".format(filepath))
+        logger.debug("Saving COP preprocessed data to file: {}".format(filepath))
+        if cls.cop_data_format == "store":
+            cls.cop_data_store.append(cls.build_cop_data_filepath(filepath), preprocessed_cop_data["COP_x"],
+                                      preprocessed_cop_data["COP_y"], cls.acq_frequency)
+        elif cls.cop_data_format == "npz":
+            save_as_npz({**preprocessed_cop_data, "acquisition_frequency": cls.acq_frequency}, filepath,
+                        folder_to_replace="BalanceBoard/Repro", destination_folder="results/cop_data",
+                        name_extension=cls.cop_data_extension)
+        else:
             save_as_json(preprocessed_cop_data, filepath, folder_to_replace="BalanceBoard/Repro",
-                         destination_folder="results/cop_data", name_extension="_cop.json")
+                         destination_folder="results/cop_data", name_extension=cls.cop_data_extension)
 
-            # Plot and save the stabilograms
-            logger.debug("Saving stabilograms plots to file: {}".format(filepath))
-            plot_stabilograms(preprocessed_cop_data, device_name, self.acq_frequency, filepath=filepath)
+    def plot_preprocessed_cop_data(self, preprocessed_cop_data, filepath, balance_board=False):
+        if balance_board:
+            device_name = "Wii Balance Board"
+        else:
+            device_name = "Force plate"
 
-        except Exception as err:
-            logger.error(": {} \n Problem with file:{}".format(err, filepath), exc_info=True, stack_info=True)
+        logger.debug("Saving stabilograms plots to file: {}".format(filepath))
+        self.plot_renderer.plot_stabilograms(preprocessed_cop_data, device_name, self.acq_frequency, filepath)
+
+    @classmethod
+    def build_cop_data_filepath(cls, filepath):
+        """Build the path of the COP data file of an acquisition file, which also identifies it in the COP data store."""
+
+        return build_filepath(filepath, folder_to_replace="BalanceBoard/Repro", destination_folder="results/cop_data",
+                              name_extension=cls.cop_data_extension)
+
+    def build_output_filepath(self, filepath):
+        """Build the path of the output file of an acquisition file, which is recorded by the incremental processing."""
+
+        return self.build_cop_data_filepath(filepath)
 
-    def preprocess_all_files(self, external_logger, balance_board=False):
-        """Preprocess all c3d files."""
+    def open_processing_manifest(self):
+        """Open the processing manifest, whose outputs are the keys of the COP data store if it is used."""
+
+        if self.cop_data_format == "store":
+            return ProcessingManifest(self.processing_manifest_file, self.output_modules,
+                                      output_exists=self.cop_data_store.__contains__)
+
+        return ProcessingManifest(self.processing_manifest_file, self.output_modules)
+
+    def get_worker_arguments(self):
+        """Get the arguments used to create the pipeline objects of the worker processes."""
+
+        return {"plot_renderer": self.plot_renderer, "stage_timer": StageTimer(self.stage_timer.enabled),
+                "file_profiler": self.file_profiler}
+
+    def preprocess_all_files(self, external_logger, balance_board=False, jobs=1, incremental=False):
+        """
+        Preprocess all c3d files, in a pool of worker processes if several jobs are used.
+
+        In incremental mode, only the files whose outputs are outdated according to the processing manifest are
+        preprocessed, i.e the new or modified files, or all the files when the configuration or the code changed.
+        """
 
         if self.acquisition_data is not None:
-            for acquisition_file in tqdm(self.acquisition_data):
-                external_logger.debug("Preprocessing acquisition file: {}".format(acquisition_file))
-                self.preprocess_acquisition_file(acquisition_file, balance_board)
+            acquisition_files = self.acquisition_data
+
+            if incremental:
+                manifest = self.open_processing_manifest()
+                keys, acquisition_files = manifest.select_outdated_files(acquisition_files, self.build_output_filepath,
+                                                                         self.output_config_sections)
+                external_logger.info("{} acquisition files up to date, {} to preprocess".format(
+                    len(self.acquisition_data) - len(acquisition_files), len(acquisition_files)))
+
+            if jobs > 1:
+                failed_files = self.preprocess_all_files_in_parallel(external_logger, balance_board, jobs,
+                                                                     acquisition_files)
+            else:
+                failed_files = []
+                for acquisition_file in tqdm(acquisition_files):
+                    external_logger.debug("Preprocessing acquisition file: {}".format(acquisition_file))
+                    if not self.preprocess_acquisition_file(acquisition_file, balance_board):
+                        failed_files.append(acquisition_file)
+
+            if incremental:
+                manifest.record_processed_files(keys, acquisition_files, failed_files, self.build_output_filepath)
+
+            # Remove the superseded trials of the COP data store, once all the workers have appended their trials
+            if self.cop_data_format == "store":
+                self.cop_data_store.close()
         else:
             external_logger.critical("No files to preprocess.")
             sys.exit()
 
+    def preprocess_all_files_in_parallel(self, external_logger, balance_board=False, jobs=2, acquisition_files=None):
+        """
+        Preprocess all c3d files in a pool of worker processes, each with its own acquisition reader and data preprocessor.
+
+        Each file is preprocessed independently of the worker which handles it, and the progress and errors are reported
+        by the parent process in the order of the files, so that the outputs and logs do not depend on the number of jobs.
+        Returns the list of the files whose preprocessing failed.
+        """
+
+        if acquisition_files is None:
+            acquisition_files = self.acquisition_data
+
+        external_logger.debug("Preprocessing {} acquisition files with {} jobs".format(len(acquisition_files), jobs))
+        failed_files = []
+
+        with ProcessPoolExecutor(max_workers=jobs, initializer=initialize_worker,
+                                 initargs=(type(self), self.get_worker_arguments())) as executor:
+            results = executor.map(preprocess_acquisition_file_in_worker, acquisition_files, repeat(balance_board))
+
+            for acquisition_file, error, timing_record in tqdm(results, total=len(acquisition_files)):
+                external_logger.debug("Preprocessed acquisition file: {}".format(acquisition_file))
+                self.stage_timer.add_record(timing_record)
+                if error is not None:
+                    logger.error(": {} \n Problem with file:{}".format(error, acquisition_file))
+                    failed_files.append(acquisition_file)
+
+        external_logger.info("{} acquisition files preprocessed, {} failed".format(
+            len(acquisition_files) - len(failed_files), len(failed_files)))
+
+        return failed_files
+
+    def profile_acquisition_files(self, external_logger, acquisition_files, balance_board=False):
+        """Preprocess acquisition files again, e.g the slowest files of a run, with their preprocessing being profiled."""
+
+        for acquisition_file in acquisition_files:
+            external_logger.info("Profiling the preprocessing of acquisition file: {}".format(acquisition_file))
+            self.preprocess_acquisition_file(acquisition_file, balance_board)
+
     def set_pipeline_acquisition_data(self, files):
         """Set the input acquisition data of the pipeline."""
 
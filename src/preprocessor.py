@@ -3,9 +3,12 @@ import logging
 import warnings
 
 import numpy as np
-import pandas as pd
 import scipy.signal
-from resampling import SWARII
+from resampling import SWARII, StreamingSWARII
+from filtering import ButterworthFilterBank
+from fourier_resampling import PairedFourierResampler
+from channel_matrix import ChannelMatrix
+from stage_timer import StageTimer, timed_stage
 # Built-in modules imports
 from utils import load_config
 
@@ -20,6 +23,8 @@ warnings.filterwarnings('error')
 
 logging.captureWarnings(True)
 
+logger = logging.getLogger("pipeline")
+
 
 class DataPreprocessor(SWARII):
     """
@@ -36,38 +41,76 @@ class DataPreprocessor(SWARII):
 
     fp_up = config["preprocessing_parameters"]["fp_upsampling_factor"]
     fp_down = config["preprocessing_parameters"]["fp_downsampling_factor"]
+    fp_decimate_first = config["preprocessing_parameters"]["fp_decimate_first"]
     order = config["preprocessing_parameters"]["filter_order"]
     fc = config["preprocessing_parameters"]["cutoff_frequency"]
     detrending_type = config["preprocessing_parameters"]["detrending_type"]
     low_thresh = config["preprocessing_parameters"]["time_window_lower_threshold"]
     up_thresh = config["preprocessing_parameters"]["time_window_upper_threshold"]
     time_shift = config["preprocessing_parameters"]["time_shift"]
+    crop_with_margin = config["preprocessing_parameters"]["crop_with_margin"]
+    crop_margin = config["preprocessing_parameters"]["crop_margin"]
     swarii_window = config["preprocessing_parameters"]["swarii_window_size"]
     acq_frequency = config["preprocessing_parameters"]["acquisition_frequency"]
     use_swarii = config["preprocessing_parameters"]["apply_swarii"]
+    swarii_engine = config["preprocessing_parameters"]["swarii_engine"]
+    fourier_engine = config["preprocessing_parameters"]["fourier_engine"]
     scale_factor = config["preprocessing_parameters"]["scaling_factor"]
+    missing_data_method = config["preprocessing_parameters"]["missing_data_method"]
+    force_plate_labels = config["force_plate_labels"]["analog_labels"]
+    dz = config["force_plate_parameters"]["dz"]
+    min_vertical_force = config["force_plate_parameters"]["min_vertical_force"]
+
+    # Timer of the preprocessing stages, disabled unless the pipeline enables it
+    stage_timer = StageTimer()
 
     def __init__(self):
         super(DataPreprocessor, self).__init__(window_size=self.swarii_window, desired_frequency=self.acq_frequency)
 
-    def apply_swarii_resampling(self, input_signal, timestamps):
-        """Apply the SWARII to resample a given signal."""
+    @timed_stage("swarii")
+    def apply_swarii_resampling(self, input_signal, timestamps, output_slice=None):
+        """
+        Apply the SWARII to resample a given signal.
+
+        The SWARII implementation used ("vectorized" or "reference") can be specified through the configuration file.
+        With the vectorized implementation, only the resampled samples within output_slice can be computed.
+        """
 
-        resampled_time, resampled_signal = self.resample(timestamps, input_signal)
+        if self.swarii_engine == "vectorized":
+            resampled_time, resampled_signal = self.fast_resample(timestamps, input_signal, output_slice)
+        else:
+            resampled_time, resampled_signal = self.resample(timestamps, input_signal)
 
         return resampled_signal
 
+    def create_swarii_stream(self):
+        """
+        Create a streaming SWARII resampler with the preprocessing parameters, which allows the balance board data to be
+        resampled chunk by chunk while it is being acquired.
+        """
+
+        return StreamingSWARII(window_size=self.window_size, desired_frequency=self.desired_frequency)
+
+    @timed_stage("fourier resampling")
     def apply_resampling(self, input_signal, num):
         """
         Resample the input signal using Fourier method.
 
+        The Fourier resampling implementation used ("paired" or "reference") can be specified through the configuration
+        file. The "paired" implementation computes a single complex FFT per pair of channels, which is faster when the
+        number of samples is not a fast FFT size.
+
         References
         ----------
         .. [1] Scipy documentation: https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.resample.html#scipy.signal.resample
          """
 
-        return scipy.signal.resample(input_signal, num)
+        if self.fourier_engine == "paired":
+            return PairedFourierResampler.resample(input_signal, num)
 
+        return scipy.signal.resample(input_signal, num, axis=0)
+
+    @timed_stage("downsampling")
     def apply_downsampling(self, input_signal, down):
         """
         Downsample the input signal.
@@ -77,7 +120,7 @@ class DataPreprocessor(SWARII):
         .. [1] Scipy documentation: https://docs.scipy.org/doc/scipy-1.1.0/reference/generated/scipy.signal.resample_poly.html#scipy.signal.resample_poly
         """
 
-        return scipy.signal.decimate(input_signal, down)
+        return scipy.signal.decimate(input_signal, down, axis=0)
 
     def apply_polyphase_resampling(self, input_signal, up, down):
         """
@@ -90,26 +133,24 @@ class DataPreprocessor(SWARII):
 
         return scipy.signal.resample_poly(input_signal, up, down)
 
+    @timed_stage("filtering")
     def apply_filtering(self, input_signal):
         """
-        Create and apply a low pass butterworth filter. The order and the cutoff frequencies of the filter can be specified through the configuration file.
-        The butter digital filter is applied forward and backward to the input signal.
+        Apply a low pass butterworth filter to the input signal. The order and the cutoff frequencies of the filter can be specified through the configuration file.
+        The butter digital filter, in second-order sections form, is applied forward and backward to the input signal.
+
+        The filter design is cached by the filter bank and a 2-d (samples x channels) input signal is filtered in a single pass.
 
         References
         ----------
         .. [1] Scipy documentation: https://docs.scipy.org/doc/scipy-1.1.0/reference/generated/scipy.signal.butter.html#scipy.signal.butter
 
-        .. [2]Scipy documentation: https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.filtfilt.html
+        .. [2]Scipy documentation: https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.sosfiltfilt.html
         """
 
-        # Create the low pass butterworth filter
-        b, a = scipy.signal.butter(self.order, self.fc / (0.5 * self.acq_frequency))
-
-        # Apply the filter to the input signal
-        filtered_signal = scipy.signal.filtfilt(b, a, input_signal)
-
-        return filtered_signal
+        return ButterworthFilterBank.apply(input_signal, self.order, self.fc, self.acq_frequency)
 
+    @timed_stage("detrending")
     def apply_detrending(self, input_signal):
         """
         Detrend the input signal by removing a linear trend or just the mean of the signal.
@@ -119,7 +160,7 @@ class DataPreprocessor(SWARII):
         .. [1] Scipy documentation: https://docs.scipy.org/doc/scipy-1.1.0/reference/generated/scipy.signal.detrend.html#scipy.signal.detrend.
         """
 
-        return scipy.signal.detrend(input_signal, type=self.detrending_type)
+        return scipy.signal.detrend(input_signal, type=self.detrending_type, axis=0)
 
     def apply_reframing(self, input_signal, balance_board, threshold_1=low_thresh, threshold_2=up_thresh):
         """Remove the beginning and the end of the input signal based on some arbitrary chosen thresholds and remove the acquisition time shift between the two devices."""
@@ -133,17 +174,26 @@ class DataPreprocessor(SWARII):
         return input_signal * scale_factor
 
 
-    def preprocess_signal(self, input_signal, balance_board=False, timestamps=None):
+    def preprocess_signal(self, input_signal, balance_board=False, timestamps=None, offset=0):
         """
         Pipeline the preprocessing steps.
 
         The SWARII resampling is applied to the wii balance board data in order to match the downsampled force plate sampling frequency (using polyphase resampling).
 
         NB: The WBB signal doesn't need to be filtered "as doing averages over a window already denoises the signal" (cf SWARII paper).
+
+        When cropping with margin is enabled, only the samples needed for the reframed window, plus a filter settling margin,
+        are filtered. The offset is the index, at the output sampling frequency, of the first sample of a force plate input
+        signal which has already been cropped (see compute_crop_range).
         """
 
         if balance_board:
-            if self.use_swarii:
+            if self.use_swarii and self.crop_with_margin and self.swarii_engine == "vectorized":
+                # Only resample the reframed window since the SWARII samples are computed independently of each other
+                reframed_data = self.apply_swarii_resampling(input_signal, timestamps,
+                                                             output_slice=slice(self.low_thresh, self.up_thresh))
+
+            elif self.use_swarii:
                 # Resample the balance board data using SWARII
                 resampled_signal = self.apply_swarii_resampling(input_signal, timestamps)
                 # rescaled_data = self.apply_rescaling(resampled_signal)
@@ -154,23 +204,51 @@ class DataPreprocessor(SWARII):
                 acquisition_duration = timestamps[-1]
                 num = round(acquisition_duration * self.acq_frequency)
                 resampled_signal = self.apply_resampling(input_signal, num)
+                if self.crop_with_margin:
+                    sample_range, offset = self.compute_crop_range(resampled_signal.shape[0], balance_board)
+                    resampled_signal = resampled_signal[sample_range]
                 filtered_signal = self.apply_filtering(resampled_signal)
                 # rescaled_data = self.apply_rescaling(filtered_signal)
-                reframed_data = self.apply_reframing(filtered_signal, balance_board)
-
+                reframed_data = self.apply_reframing(filtered_signal, balance_board, self.low_thresh - offset,
+                                                     self.up_thresh - offset)
 
         else:
-            # Downsample the force plate data using decimation
-            resampled_signal = self.apply_downsampling(input_signal, self.fp_down)
+            if self.fp_decimate_first:
+                # The force plate sensor values have already been decimated before the COP computations
+                resampled_signal = input_signal
+            else:
+                # Downsample the force plate data using decimation
+                resampled_signal = self.apply_downsampling(input_signal, self.fp_down)
             filtered_signal = self.apply_filtering(resampled_signal)
-            reframed_data = self.apply_reframing(filtered_signal, balance_board)
+            reframed_data = self.apply_reframing(filtered_signal, balance_board, self.low_thresh - offset,
+                                                 self.up_thresh - offset)
 
         detrended_data = self.apply_detrending(reframed_data)
 
         return detrended_data
 
+    def compute_crop_range(self, number_of_samples, balance_board=False, factor=1):
+        """
+        Compute the range of the samples needed for the reframed window, extended by the filter settling margin on both
+        sides, for a signal whose sampling frequency is factor times the output sampling frequency.
+
+        Returns the range of the samples, whose first sample is aligned on the output samples, and the index of the first
+        sample at the output sampling frequency.
+        """
+
+        time_shift = 0 if balance_board else self.time_shift
+        offset = max(self.low_thresh + time_shift - self.crop_margin, 0)
+        stop = min((self.up_thresh + time_shift + self.crop_margin) * factor, number_of_samples)
+
+        return slice(offset * factor, stop), offset
+
     def preprocess_raw_data(self, data, balance_board=False):
-        """Preprocess the raw data"""
+        """
+        Preprocess the raw data.
+
+        The COP coordinates are preprocessed together as a single (samples x channels) array, so that the SWARII windows
+        and the filters are computed and applied only once for all the coordinates.
+        """
 
         if balance_board:
             relative_timestamps = data[0]
@@ -178,15 +256,91 @@ class DataPreprocessor(SWARII):
         else:
             relative_timestamps = None
 
-        cop_data = self.compute_cop_positions(data, balance_board)
-        for key, value in cop_data.items():
-            cop_data[key] = self.preprocess_signal(input_signal=value,
-                                                   balance_board=balance_board, timestamps=relative_timestamps)
+        # Only compute the force plate COP positions on the samples needed for the reframed window
+        sample_range, offset = None, 0
+        if not balance_board and self.crop_with_margin:
+            number_of_samples = data[self.force_plate_labels[0]].shape[0]
+            sample_range, offset = self.compute_crop_range(number_of_samples, factor=self.fp_down)
+
+        cop_data = self.compute_cop_positions(data, balance_board, sample_range)
+
+        labels, stacked_cop_data = self.stack_cop_data(cop_data)
+        preprocessed_cop_data = self.preprocess_signal(input_signal=stacked_cop_data, balance_board=balance_board,
+                                                       timestamps=relative_timestamps, offset=offset)
+
+        return self.unstack_cop_data(labels, preprocessed_cop_data)
+
+    def preprocess_raw_data_swarii_window_sizes(self, data, window_sizes):
+        """
+        Preprocess the raw WBB data with several SWARII window sizes.
+
+        The SWARII precomputations which don't depend on the window size are shared across all the window sizes.
+        """
+
+        relative_timestamps = data[0]
+        cop_data = self.compute_cop_positions(data[1], balance_board=True)
+
+        labels, stacked_cop_data = self.stack_cop_data(cop_data)
+        resampled_time, resampled_signals = self.sweep_window_sizes(relative_timestamps, stacked_cop_data,
+                                                                    window_sizes)
+
+        return [self.unstack_cop_data(labels, self.apply_detrending(self.apply_reframing(resampled_signal, True)))
+                for resampled_signal in resampled_signals]
+
+    @staticmethod
+    def stack_cop_data(cop_data):
+        """Stack the COP coordinates into a single (samples x channels) array."""
+
+        labels = list(cop_data.keys())
+
+        return labels, np.column_stack([cop_data[label] for label in labels])
+
+    @staticmethod
+    def unstack_cop_data(labels, stacked_cop_data):
+        """Split a (samples x channels) array back into a dictionary of COP coordinates."""
+
+        return {label: stacked_cop_data[:, i] for i, label in enumerate(labels)}
+
+    def compute_decimate_first_parity(self, raw_data):
+        """
+        Preprocess the raw force plate data with and without decimating the sensor values before the COP computations, and
+        compare the results.
+
+        Returns the preprocessed COP data of both modes, along with the parity report of each COP coordinate.
+        """
+
+        decimate_first = self.fp_decimate_first
+        try:
+            self.fp_decimate_first = False
+            reference_cop_data = self.preprocess_raw_data(raw_data)
+            self.fp_decimate_first = True
+            decimate_first_cop_data = self.preprocess_raw_data(raw_data)
+        finally:
+            self.fp_decimate_first = decimate_first
+
+        return reference_cop_data, decimate_first_cop_data, self.compute_parity_report(reference_cop_data,
+                                                                                       decimate_first_cop_data)
+
+    @staticmethod
+    def compute_parity_report(reference_cop_data, cop_data):
+        """Compute the maximum absolute difference, the root mean square difference and the correlation of COP data."""
+
+        report = {}
+        for key, reference_value in reference_cop_data.items():
+            difference = cop_data[key] - reference_value
+            report[key] = {"max absolute difference": np.max(np.abs(difference)),
+                           "rms difference": np.sqrt(np.mean(np.square(difference))),
+                           "correlation": np.corrcoef(reference_value, cop_data[key])[0][1]}
 
-        return cop_data
+        return report
 
-    def compute_cop_positions(self, raw_data, balance_board=False):
-        """Compute the COP positions in the AP and ML directions."""
+    @timed_stage("cop positions")
+    def compute_cop_positions(self, raw_data, balance_board=False, sample_range=None):
+        """
+        Compute the COP positions in the AP and ML directions.
+
+        The force plate COP positions can be computed on a range of the samples only.
+        """
 
         cop_data = {}
         try:
@@ -194,58 +348,145 @@ class DataPreprocessor(SWARII):
                 cop_data["COP_x"] = raw_data["Accelerometer"][:, 0]
                 cop_data["COP_y"] = raw_data["Accelerometer"][:, 1]
             else:
-                cop_data["COP_x"] = self.compute_cop_fp_x(raw_data)
-                cop_data["COP_y"] = self.compute_cop_fp_y(raw_data)
+                repaired_data = self.repair_force_plate_data(raw_data)
+                if sample_range is not None:
+                    repaired_data = repaired_data[sample_range]
+                if self.fp_decimate_first:
+                    # Anti-alias filter and decimate all the sensor values at once, and compute the COP at the target rate
+                    repaired_data = self.apply_downsampling(repaired_data, self.fp_down)
+                cop_fp = self.compute_cop_fp(repaired_data)
+                cop_data["COP_x"] = cop_fp[:, 0]
+                cop_data["COP_y"] = cop_fp[:, 1]
 
             return cop_data
 
         except Exception:
             raise
 
-    def compute_cop_fp_x(self, data):
-        """Compute the y coordinate of the force plate center of pressure (ML direction)."""
+    def repair_force_plate_data(self, raw_data):
+        """
+        Replace the missing (null) values of all the force plate sensors at once.
+
+        The sensor values are stacked into a single (samples x channels) array, whose columns follow the order of the force
+        plate labels, which is repaired in one pass, and the missing data statistics are logged for quality control. The
+        raw data which is already read as a channel matrix is used as is.
+        """
+
+        labels = self.force_plate_labels
+        if isinstance(raw_data, ChannelMatrix):
+            data = raw_data.get_columns(labels)
+        else:
+            data = np.hstack([raw_data[label].reshape(-1, 1) for label in labels])
+
+        gap_statistics = self.compute_missing_data_statistics(data)
+        for i, label in enumerate(labels):
+            logger.debug("{} missing data: {} samples in {} gaps, longest gap: {} samples".format(
+                label, gap_statistics["missing_samples"][i], gap_statistics["gap_count"][i],
+                gap_statistics["longest_gap"][i]))
+
+        return self.replace_missing_data(data)
+
+    def compute_cop_fp(self, data, labels=force_plate_labels):
+        """
+        Compute both coordinates of the force plate center of pressure from a (samples x channels) array of the force plate
+        sensor values, whose columns follow the order of the given labels.
+
+        The COP_x (ML direction) and COP_y (AP direction) coordinates are returned together in a (samples x 2) array. The
+        samples for which the vertical force is close to zero (e.g. feet off the plate) are masked and replaced with the
+        missing data replacement method instead of producing infinite values. A ValueError is raised if the vertical force
+        is close to zero for all the samples, since there is no COP value to replace them with.
+        """
+
+        Fx1, Fy1, Fz1, Mx1, My1 = (data[:, labels.index(label)] for label in ["Fx1", "Fy1", "Fz1", "Mx1", "My1"])
+
+        cop_fp = np.empty((data.shape[0], 2))
+        np.subtract(self.dz * Fy1, Mx1, out=cop_fp[:, 0])
+        np.add(My1, self.dz * Fx1, out=cop_fp[:, 1])
+        np.negative(cop_fp[:, 1], out=cop_fp[:, 1])
+
+        valid = np.abs(Fz1) > self.min_vertical_force
+        if not np.any(valid):
+            raise ValueError("Vertical force below {} N for all the {} samples".format(self.min_vertical_force,
+                                                                                       len(valid)))
+
+        np.divide(cop_fp, Fz1[:, None], out=cop_fp, where=valid[:, None])
+
+        if not np.all(valid):
+            logger.warning("Vertical force below {} N for {} of {} samples, replaced with the {} method".format(
+                self.min_vertical_force, np.count_nonzero(~valid), len(valid), self.missing_data_method))
+            cop_fp = self.replace_missing_data(cop_fp, missing=np.repeat(~valid[:, None], 2, axis=1))
+
+        return cop_fp
+
+    @staticmethod
+    def compute_missing_data_indices(missing):
+        """
+        Compute, for every sample of a 2-d (samples x channels) array, the indices of the previous and next non missing
+        samples of the same channel. The previous index is -1 and the next index is n when there is no such sample.
+        """
 
-        # Force plate height (in mm)
-        dz = config["force_plate_parameters"]["dz"]
+        n = missing.shape[0]
+        indices = np.arange(n)[:, None]
 
-        # Force plate sensor values
-        Fy1 = data["Fy1"].flatten()
-        Mx1 = data["Mx1"].flatten()
-        Fz1 = data["Fz1"].flatten()
+        previous_indices = np.maximum.accumulate(np.where(missing, -1, indices), axis=0)
+        next_indices = np.minimum.accumulate(np.where(missing, n, indices)[::-1], axis=0)[::-1]
 
-        # Replace null data with previous/following non null values
-        Fy1 = self.replace_missing_data(Fy1)
-        Mx1 = self.replace_missing_data(Mx1)
-        Fz1 = self.replace_missing_data(Fz1)
+        return previous_indices, next_indices
 
-        cop_fp_x = -(Mx1 - dz * Fy1) / (Fz1)
+    @staticmethod
+    def replace_missing_data(data, method=missing_data_method, missing=None):
+        """
+        Replace the missing (null) values of a 1-d signal or of every channel of a 2-d (samples x channels) signal. A
+        boolean mask of the same shape as the signal can be given to specify other missing values than the null ones.
 
-        return cop_fp_x
+        With the "ffill" method, the missing values are replaced with the previous non null value, or with the next one at
+        the beginning of the signal. With the "linear" method, they are linearly interpolated between the previous and the
+        next non null values, and replaced with the nearest non null value at the borders of the signal.
+        """
 
-    def compute_cop_fp_y(self, data):
-        """Compute the x coordinate of the force plate center of pressure (AP direction)."""
+        a_data = np.asarray(data, dtype=float)
+        flat_data = a_data.reshape(a_data.shape[0], -1)
+        missing = flat_data == 0 if missing is None else np.asarray(missing).reshape(flat_data.shape)
 
-        # Force plate height (in mm)
-        dz = config["force_plate_parameters"]["dz"]
+        if not np.any(missing):
+            return a_data
 
-        # Force plate sensor values
-        Fx1 = data["Fx1"].flatten()
-        My1 = data["My1"].flatten()
-        Fz1 = data["Fz1"].flatten()
+        n = flat_data.shape[0]
+        channels = np.broadcast_to(np.arange(flat_data.shape[1]), flat_data.shape)
+        previous_indices, next_indices = DataPreprocessor.compute_missing_data_indices(missing)
 
-        # Replace null data with previous or next non null values
-        Fx1 = self.replace_missing_data(Fx1)
-        My1 = self.replace_missing_data(My1)
-        Fz1 = self.replace_missing_data(Fz1)
+        # Channels without any non null value are left untouched
+        has_previous = previous_indices >= 0
+        has_next = next_indices < n
+        source_indices = np.where(has_previous, previous_indices, np.where(has_next, next_indices, np.arange(n)[:, None]))
+        repaired_data = flat_data[source_indices, channels]
 
-        cop_fp_y = -(My1 + (dz * Fx1)) / (Fz1)
+        if method == "linear":
+            interior = missing & has_previous & has_next
+            previous = previous_indices[interior]
+            following = next_indices[interior]
+            rows, columns = np.nonzero(interior)
+            ratio = (rows - previous) / (following - previous)
+            repaired_data[interior] = flat_data[previous, columns] + \
+                ratio * (flat_data[following, columns] - flat_data[previous, columns])
 
-        return cop_fp_y
+        return repaired_data.reshape(a_data.shape)
 
     @staticmethod
-    def replace_missing_data(data):
-        # TODO : refine this process!
-        forward_fill_missing_data = pd.DataFrame(data)[0].replace(to_replace=0, method='ffill').values
-        backward_fill_missing_data = pd.DataFrame(forward_fill_missing_data)[0].replace(to_replace=0,
-                                                                                        method='bfill').values
-        return backward_fill_missing_data
+    def compute_missing_data_statistics(data):
+        """
+        Compute the missing (null) data statistics of every channel of a 2-d (samples x channels) signal: the number of
+        missing samples, the number of gaps and the length of the longest gap (in samples).
+        """
+
+        a_data = np.asarray(data)
+        missing = a_data.reshape(a_data.shape[0], -1) == 0
+
+        gap_starts = missing.copy()
+        gap_starts[1:] &= ~missing[:-1]
+
+        previous_indices, next_indices = DataPreprocessor.compute_missing_data_indices(missing)
+        gap_lengths = np.where(missing, next_indices - previous_indices - 1, 0)
+
+        return {"missing_samples": missing.sum(axis=0), "gap_count": gap_starts.sum(axis=0),
+                "longest_gap": gap_lengths.max(axis=0)}
@@ -0,0 +1,95 @@
+# Built-in modules imports
+from utils import load_config, compute_file_hash, compute_code_version, check_folder
+
+# Third-party module imports
+import hashlib
+import json
+import os
+
+config = load_config()
+
+
+class ProcessingManifest:
+    """
+    Manifest of the outputs of the pipelines, used to only process again the files whose outputs are outdated.
+
+    Every output file is recorded with the hash of its input file, the hash of the configuration parameters it depends on
+    and the version of the code which produced it, i.e of the given source modules which the outputs depend on, so that
+    the changes of the other modules do not invalidate the outputs. An output is up to date if it exists and if its record
+    matches the key computed for the current input file, configuration and code.
+
+    The inputs and outputs are files by default, and are otherwise identified by keys, e.g of a COP data store, with the
+    given functions which compute the hash of an input and check whether an output exists.
+    """
+
+    def __init__(self, filepath, source_modules, compute_input_hash=compute_file_hash, output_exists=os.path.exists):
+        self.filepath = filepath
+        self.records = self.load(filepath)
+        self.code_version = compute_code_version(source_modules)
+        self.compute_input_hash = compute_input_hash
+        self.output_exists = output_exists
+
+    @staticmethod
+    def load(filepath):
+        if not os.path.exists(filepath):
+            return {}
+
+        with open(filepath) as manifest_file:
+            return json.load(manifest_file)
+
+    def save(self):
+        """Save the manifest, through a temporary file so that it is never left incomplete."""
+
+        check_folder(os.path.dirname(self.filepath))
+        temporary_filepath = self.filepath + ".tmp"
+        with open(temporary_filepath, "w") as manifest_file:
+            json.dump(self.records, manifest_file, indent=4, sort_keys=True)
+        os.replace(temporary_filepath, self.filepath)
+
+    @staticmethod
+    def compute_config_hash(config_sections):
+        """Compute the hash of the given sections of the configuration file."""
+
+        parameters = {section: config[section] for section in config_sections}
+
+        return hashlib.sha1(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+    def compute_key(self, input_filepath, config_sections):
+        """Compute the key of the output of an input file, which depends on the given sections of the configuration."""
+
+        return {"input_hash": self.compute_input_hash(input_filepath),
+                "config_hash": self.compute_config_hash(config_sections),
+                "code_version": self.code_version}
+
+    def is_up_to_date(self, output_filepath, key):
+        return self.output_exists(output_filepath) and self.records.get(output_filepath) == key
+
+    def record(self, output_filepath, key):
+        self.records[output_filepath] = key
+
+    def invalidate(self, output_filepath):
+        self.records.pop(output_filepath, None)
+
+    def select_outdated_files(self, input_filepaths, build_output_filepath, config_sections):
+        """
+        Select the input files whose outputs are outdated, and return them with the keys of the outputs of all the input
+        files, indexed by input file.
+        """
+
+        keys = {filepath: self.compute_key(filepath, config_sections) for filepath in input_filepaths}
+        outdated_filepaths = [filepath for filepath in input_filepaths
+                              if not self.is_up_to_date(build_output_filepath(filepath), keys[filepath])]
+
+        return keys, outdated_filepaths
+
+    def record_processed_files(self, keys, processed_filepaths, failed_filepaths, build_output_filepath):
+        """Record the outputs of the successfully processed input files, forget the failed ones and save the manifest."""
+
+        failed_filepaths = set(failed_filepaths)
+        for filepath in processed_filepaths:
+            if filepath in failed_filepaths:
+                self.invalidate(build_output_filepath(filepath))
+            else:
+                self.record(build_output_filepath(filepath), keys[filepath])
+
+        self.save()
@@ -20,3 +20,15 @@ class DataProcessor:
         frequency_domain_features = FrequencyFeatures.from_file(cop_data_file)
 
         return frequency_domain_features
+
+    @staticmethod
+    def compute_time_features_from_cop_data(cop_x, cop_y):
+        """Compute the time domain features from in memory COP data."""
+
+        return TimeFeatures(cop_x, cop_y).time_features
+
+    @staticmethod
+    def compute_frequency_features_from_cop_data(cop_x, cop_y):
+        """Compute the frequency domain features from in memory COP data."""
+
+        return FrequencyFeatures(cop_x, cop_y)
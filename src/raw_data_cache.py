@@ -0,0 +1,198 @@
+# Built-in modules imports
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# Third-party module imports
+import logging
+import numpy as np
+
+from channel_matrix import ChannelMatrix
+from utils import compute_file_hash, compute_code_version
+
+logger = logging.getLogger("pipeline")
+
+
+class RawDataCache:
+    """
+    On-disk cache of the raw data extracted from the acquisition files.
+
+    The decoded channels (and the relative timestamps of the WBB acquisitions) of each acquisition file are stored as .npy
+    files in a cache entry folder, and are memory mapped when they are read back, so that the c3d parsing and the
+    timestamps decoding are skipped when the same files are preprocessed again.
+
+    The cache entries are keyed by the content hash and modification time of the acquisition file, by the extracted
+    labels, by the reader backend and by the version of the code of the readers, so that any change of the file, of the
+    configuration or of the decoding of the raw data creates a new entry. The least recently used entries are evicted
+    when the total size of the cache exceeds its maximum size.
+    """
+
+    # Modules which decode the raw data, i.e the readers, the timestamps decoding and the channel matrix layout
+    reader_modules = ["c3d_reader", "channel_matrix", "hybrid_reader", "raw_data_cache"]
+
+    # Folder of the recorded content hashes of the acquisition files, which is never evicted
+    hashes_folder_name = ".hashes"
+
+    def __init__(self, folder, max_size):
+        self.folder = folder
+        self.max_size = max_size
+        self.code_version = compute_code_version(self.reader_modules)
+
+    def get_file_hash(self, filepath):
+        """
+        Get the content hash of a file, which is only computed when no hash is recorded for the path, size and modification
+        time of the file, i.e when the file is new or modified, so that the files are not read again at every lookup.
+        """
+
+        file_stat = os.stat(filepath)
+        stat_data = {"path": os.path.abspath(filepath), "size": file_stat.st_size, "mtime": file_stat.st_mtime_ns}
+        hash_filepath = os.path.join(self.folder, self.hashes_folder_name,
+                                     hashlib.sha1(json.dumps(stat_data, sort_keys=True).encode()).hexdigest())
+
+        try:
+            with open(hash_filepath) as hash_file:
+                file_hash = hash_file.read()
+            if len(file_hash) == hashlib.sha1().digest_size * 2:
+                return file_hash
+        except OSError:
+            pass
+
+        file_hash = compute_file_hash(filepath)
+
+        # The hash is recorded through a temporary file, so that it is never read incomplete by the parallel workers
+        try:
+            os.makedirs(os.path.dirname(hash_filepath), exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(hash_filepath), delete=False) as hash_file:
+                hash_file.write(file_hash)
+            os.replace(hash_file.name, hash_filepath)
+        except OSError as err:
+            logger.debug("Hash of file {} not recorded: {}".format(filepath, err))
+
+        return file_hash
+
+    def compute_key(self, filepath, labels, as_matrix=False, backend=None):
+        """Compute the cache key of the raw data extracted from a file with the given labels and reader backend."""
+
+        key_data = {"hash": self.get_file_hash(filepath),
+                    "mtime": os.stat(filepath).st_mtime_ns,
+                    "labels": labels,
+                    "matrix": as_matrix,
+                    "backend": backend,
+                    "code_version": self.code_version}
+
+        return hashlib.sha1(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+    def get(self, filepath, read_raw_data, labels, key_labels, balance_board=False, as_matrix=False, backend=None):
+        """
+        Get the raw data of an acquisition file from the cache, or read it with the given function and store it in the
+        cache if it is not cached yet.
+
+        The raw data has the same structure as the data returned by HybridAcquisitionReader.get_raw_data, i.e a dictionary
+        of the values of the channels with the given labels, preceded by the relative timestamps for the WBB acquisitions.
+        The key labels are all the labels used to extract the raw data, e.g including the WBB timestamps labels. The channels
+        are stored and loaded as a single channel matrix if specified. The entries of the reader backends are kept apart, so
+        that the raw data read by a backend is never served to another one.
+        """
+
+        entry_folder = os.path.join(self.folder, self.compute_key(filepath, key_labels, as_matrix, backend))
+
+        if os.path.isdir(entry_folder):
+            try:
+                raw_data = self.load_entry(entry_folder, labels, balance_board, as_matrix)
+                # The modification time of the entry folder records its last use, for the eviction
+                os.utime(entry_folder)
+                return raw_data
+            except (IOError, ValueError) as err:
+                logger.warning("Invalid raw data cache entry {}: {}".format(entry_folder, err))
+                shutil.rmtree(entry_folder, ignore_errors=True)
+
+        raw_data = read_raw_data()
+        self.store_entry(entry_folder, raw_data, labels, balance_board, as_matrix)
+        self.evict()
+
+        return raw_data
+
+    @staticmethod
+    def load_entry(entry_folder, labels, balance_board, as_matrix=False):
+        """Load the memory mapped raw data of a cache entry."""
+
+        if as_matrix:
+            values = np.load(os.path.join(entry_folder, "matrix.npy"), mmap_mode="r")
+            columns_number = values.shape[1] // len(labels)
+            channels = ChannelMatrix(values, {label: slice(i * columns_number, (i + 1) * columns_number)
+                                              for i, label in enumerate(labels)})
+        else:
+            channels = {label: np.load(os.path.join(entry_folder, "{}.npy".format(i)), mmap_mode="r")
+                        for i, label in enumerate(labels)}
+
+        if balance_board:
+            return [np.load(os.path.join(entry_folder, "timestamps.npy"), mmap_mode="r"), channels]
+
+        return channels
+
+    def store_entry(self, entry_folder, raw_data, labels, balance_board, as_matrix=False):
+        """Store raw data as a new cache entry, which is written in a temporary folder first to never be left incomplete."""
+
+        os.makedirs(self.folder, exist_ok=True)
+        temporary_folder = tempfile.mkdtemp(dir=self.folder, prefix=".tmp")
+
+        try:
+            if balance_board:
+                np.save(os.path.join(temporary_folder, "timestamps.npy"), np.asarray(raw_data[0], dtype=float))
+                channels = raw_data[1]
+            else:
+                channels = raw_data
+
+            if as_matrix:
+                np.save(os.path.join(temporary_folder, "matrix.npy"), channels.get_columns(labels))
+            else:
+                for i, label in enumerate(labels):
+                    np.save(os.path.join(temporary_folder, "{}.npy".format(i)), np.ascontiguousarray(channels[label]))
+
+            os.rename(temporary_folder, entry_folder)
+        except OSError as err:
+            # The entry may have been stored concurrently, the raw data is returned anyway
+            logger.debug("Raw data cache entry {} not stored: {}".format(entry_folder, err))
+            shutil.rmtree(temporary_folder, ignore_errors=True)
+
+    @staticmethod
+    def compute_folder_size(folder):
+        size = 0
+        for entry in os.scandir(folder):
+            try:
+                if entry.is_file():
+                    size += entry.stat().st_size
+            except FileNotFoundError:
+                continue
+
+        return size
+
+    def evict(self):
+        """
+        Remove the least recently used cache entries until the cache size is below its maximum size.
+
+        The entries may be evicted concurrently by the parallel workers of the pipelines, so the entries which vanish while
+        they are examined are skipped.
+        """
+
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            try:
+                entries.append((entry.stat().st_mtime, entry.path, self.compute_folder_size(entry.path)))
+            except FileNotFoundError:
+                continue
+
+        total_size = sum(size for _, _, size in entries)
+        for _, entry_path, size in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            logger.debug("Evicting raw data cache entry: {}".format(entry_path))
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total_size -= size
+
+    def clear(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
@@ -112,3 +112,404 @@ class SWARII:
             current_time += 1. / self.desired_frequency
 
         return np.array(output_time), np.array(output_signal)
+
+    def fast_resample(self, time, signal, output_slice=None):
+        """
+        Apply the SWARII to resample a given signal, using sorted searches and
+        cumulative sums instead of scanning the whole signal for every output
+        sample. The output is identical (up to floating point rounding) to the
+        one of resample.
+
+        The time stamps are expected to be sorted in increasing order, if they
+        are not the method falls back on resample.
+
+        An optional output_slice restricts the computations to a range of the
+        resampled points, e.g. to the part of the signal which is kept after
+        reframing.
+
+        Input :
+            time:   The time stamps of the the data point in the signal. A 1-d
+                    array of shape n, where n is the number of points in the
+                    signal. The unit is seconds.
+            signal: The data points representing the signal. A k-d array of
+                    shape (n,k), where n is the number of points in the signal,
+                    and k is the dimension of the signal (e.g. 2 for a
+                    statokinesigram).
+
+        Output:
+            resampled_time : The time stamps of the signal after the resampling
+            resampled_signal : The resampled signal.
+        """
+
+        a_time = np.asarray(time, dtype=float)
+
+        if np.any(np.diff(a_time) < 0):
+            resampled_time, resampled_signal = self.resample(time, signal)
+            if output_slice is not None:
+                return resampled_time[output_slice], resampled_signal[output_slice]
+            return resampled_time, resampled_signal
+
+        a_signal = np.asarray(signal, dtype=float)
+        output_time = self.compute_output_times(a_time)
+        if output_slice is not None:
+            output_time = output_time[output_slice]
+
+        if output_time.size == 0:
+            return output_time, np.array([])
+
+        # Work on a 2-d view of the signal so that the weights broadcast over every dimension
+        flat_signal = a_signal.reshape(a_time.size, -1)
+        output_signal = self.compute_weighted_averages(a_time, flat_signal, output_time, a_time[0], a_time[-1])
+
+        return output_time, output_signal.reshape((output_time.size,) + a_signal.shape[1:])
+
+    def sweep_window_sizes(self, time, signal, window_sizes):
+        """
+        Apply the SWARII to resample a given signal with several sliding window sizes.
+
+        The output time stamps, the Voronoi weights and the cumulative sums of the
+        signal do not depend on the window size, so they are computed only once
+        for all the window sizes.
+
+        Input :
+            time:   The time stamps of the the data point in the signal. A 1-d
+                    array of shape n, where n is the number of points in the
+                    signal. The unit is seconds.
+            signal: The data points representing the signal. A k-d array of
+                    shape (n,k).
+            window_sizes: The sizes of the sliding windows, in seconds.
+
+        Output:
+            resampled_time : The time stamps of the signal after the resampling
+            resampled_signals : The list of the resampled signals, one for each
+                                window size. The signal of a window size which
+                                is too small for some of its windows to hold a
+                                data point is filled with NaN, so that the
+                                sweep goes on with the other window sizes.
+        """
+
+        a_time = np.asarray(time, dtype=float)
+        a_signal = np.asarray(signal, dtype=float)
+        output_time = self.compute_output_times(a_time)
+
+        if np.any(np.diff(a_time) < 0):
+            resampled_signals = []
+            for window_size in window_sizes:
+                try:
+                    resampled_signals.append(SWARII(window_size=window_size, desired_frequency=self.desired_frequency)
+                                             .resample(time, signal)[1])
+                except AssertionError:
+                    resampled_signals.append(np.full((output_time.size,) + a_signal.shape[1:], np.nan))
+            return output_time, resampled_signals
+
+        if output_time.size == 0:
+            return output_time, [np.array([]) for window_size in window_sizes]
+
+        flat_signal = a_signal.reshape(a_time.size, -1)
+        voronoi_weights = self.compute_voronoi_weights(a_time)
+        cumulated_values = self.compute_cumulated_values(flat_signal, voronoi_weights["inner_weights"])
+
+        resampled_signals = []
+        for window_size in window_sizes:
+            try:
+                window_weights = self.compute_window_weights(a_time, output_time, a_time[0], a_time[-1],
+                                                             window_size=window_size, voronoi_weights=voronoi_weights)
+            except AssertionError:
+                resampled_signals.append(np.full((output_time.size,) + a_signal.shape[1:], np.nan))
+                continue
+
+            output_signal = self.apply_window_weights(window_weights, flat_signal, cumulated_values)
+            resampled_signals.append(output_signal.reshape((output_time.size,) + a_signal.shape[1:]))
+
+        return output_time, resampled_signals
+
+    def compute_weighted_averages(self, time, flat_signal, output_time, first_time, last_time):
+        """
+        Compute the SWARII values of a 2-d signal of shape (n,k) at the given output time stamps.
+
+        first_time and last_time are the first and last time stamps of the whole
+        signal, which bound the borders of the first and last sliding windows.
+        """
+
+        window_weights = self.compute_window_weights(time, output_time, first_time, last_time)
+
+        return self.apply_window_weights(window_weights, flat_signal)
+
+    def compute_window_weights(self, time, output_time, first_time, last_time, window_size=None,
+                               voronoi_weights=None):
+        """
+        Compute the sliding windows and the weights of their data points, which only depend on the time stamps.
+
+        The windows are described by the range [lower, upper) of the indices of
+        their data points. The weights of the data points lying strictly inside a
+        window are the lengths of their Voronoi cells, while the weights of the
+        first and last data points of a window are bounded by the window borders.
+
+        The window size defaults to the one of the instance, and the Voronoi
+        weights returned by compute_voronoi_weights can be passed in order to
+        reuse them across several window sizes.
+
+        Output:
+            window_weights : A dictionary holding the window bounds and weights,
+                             to be used with apply_window_weights.
+        """
+
+        if window_size is None:
+            window_size = self.window_size
+
+        if voronoi_weights is None:
+            voronoi_weights = self.compute_voronoi_weights(time)
+
+        lower, upper = self.compute_window_bounds(time, output_time, window_size)
+
+        assert np.all(upper > lower), "Trying to interpolate an empty window !"
+
+        multiple = (upper - lower) > 1
+        lo = lower[multiple]
+        hi = upper[multiple]
+        current_time = output_time[multiple]
+        half_window = window_size * 0.5
+
+        midpoints = voronoi_weights["midpoints"]
+        cumulated_weights = voronoi_weights["cumulated_weights"]
+
+        left_border = np.maximum(first_time, current_time - half_window)
+        right_border = np.minimum(last_time, current_time + half_window)
+        first_weight = midpoints[lo] - left_border
+        last_weight = right_border - midpoints[hi - 2]
+        total_weight = first_weight + last_weight + (cumulated_weights[hi - 1] - cumulated_weights[lo + 1])
+
+        return {"lower": lower, "upper": upper, "multiple": multiple,
+                "inner_weights": voronoi_weights["inner_weights"], "first_weight": first_weight,
+                "last_weight": last_weight, "total_weight": total_weight}
+
+    @staticmethod
+    def compute_voronoi_weights(time):
+        """
+        Compute the Voronoi borders between consecutive data points, and the weights of the data points lying strictly
+        inside a window (borders of the window excluded), along with their cumulative sum.
+        """
+
+        midpoints = 0.5 * (time[1:] + time[:-1])
+
+        inner_weights = np.zeros(time.size)
+        inner_weights[1:-1] = midpoints[1:] - midpoints[:-1]
+        cumulated_weights = np.concatenate(([0.], np.cumsum(inner_weights)))
+
+        return {"midpoints": midpoints, "inner_weights": inner_weights, "cumulated_weights": cumulated_weights}
+
+    @staticmethod
+    def compute_cumulated_values(flat_signal, inner_weights):
+        """Compute the cumulative sum of the weighted data points of a 2-d signal of shape (n,k)."""
+
+        return np.concatenate((np.zeros((1, flat_signal.shape[1])),
+                               np.cumsum(flat_signal * inner_weights[:, None], axis=0)))
+
+    @staticmethod
+    def apply_window_weights(window_weights, flat_signal, cumulated_values=None):
+        """
+        Compute the weighted averages of every channel of a 2-d signal of shape (n,k) over the sliding windows.
+
+        All the channels are averaged at once, so the windows and weights are
+        computed only once for signals sharing the same time stamps. The output of
+        compute_cumulated_values can be passed in order to reuse it across several
+        window sizes.
+        """
+
+        lower = window_weights["lower"]
+        upper = window_weights["upper"]
+        multiple = window_weights["multiple"]
+
+        output_signal = flat_signal[lower].copy()
+
+        if np.any(multiple):
+            lo = lower[multiple]
+            hi = upper[multiple]
+
+            if cumulated_values is None:
+                cumulated_values = SWARII.compute_cumulated_values(flat_signal, window_weights["inner_weights"])
+
+            value = flat_signal[lo] * window_weights["first_weight"][:, None] + \
+                flat_signal[hi - 1] * window_weights["last_weight"][:, None] + \
+                (cumulated_values[hi - 1] - cumulated_values[lo + 1])
+
+            output_signal[multiple] = value / window_weights["total_weight"][:, None]
+
+        return output_signal
+
+    def compute_output_times(self, time):
+        """
+        Compute the time stamps of the resampled signal.
+
+        The time stamps are accumulated exactly as in resample so that both methods
+        output the same values.
+        """
+
+        start_time = max(0., time[0])
+        if start_time >= time[-1]:
+            return np.array([])
+
+        number_of_samples = int(np.ceil((time[-1] - start_time) * self.desired_frequency)) + 2
+        increments = np.full(number_of_samples, 1. / self.desired_frequency)
+        increments[0] = start_time
+        output_time = np.cumsum(increments)
+
+        return output_time[output_time < time[-1]]
+
+    @staticmethod
+    def compute_window_bounds(time, output_time, window_size):
+        """
+        Compute, for every output time stamp, the range [lower, upper) of the indices
+        of the sorted time stamps that lie in the sliding window.
+
+        The bounds found by the sorted searches are refined so that they match the
+        abs(time - current_time) < window_size * 0.5 test used in resample.
+        """
+
+        half_window = window_size * 0.5
+        lower = np.searchsorted(time, output_time - half_window, side="right")
+        upper = np.searchsorted(time, output_time + half_window, side="left")
+
+        lower = SWARII._refine_bounds(lambda i: time[i] - output_time > -half_window, lower, time.size)
+        upper = SWARII._refine_bounds(lambda i: time[i] - output_time >= half_window, upper, time.size)
+
+        return lower, upper
+
+    @staticmethod
+    def _refine_bounds(predicate, bounds, n):
+        """Move the bounds until they point to the first index for which the (monotonic) predicate holds."""
+
+        while True:
+            move_back = (bounds > 0) & predicate(np.maximum(bounds - 1, 0))
+            move_forward = (bounds < n) & ~predicate(np.minimum(bounds, n - 1))
+
+            if not (np.any(move_back) or np.any(move_forward)):
+                return bounds
+
+            bounds = bounds - move_back + move_forward
+
+
+class StreamingSWARII(SWARII):
+    """
+    Streaming implementation of the SWARII, for signals which are acquired chunk by chunk.
+
+    How To use :
+        First instantiate the class with the desired parameters
+        Then call update on every new chunk of the signal, which returns the
+        resampled points whose sliding window is complete
+        Finally call finish once the acquisition is over to get the remaining
+        resampled points
+
+    Only the data points which can still fall into a future sliding window are
+    kept in memory. The concatenation of the outputs is identical (up to
+    floating point rounding) to the output of resample on the whole signal.
+    """
+
+    def __init__(self, window_size=1, desired_frequency=25):
+        super(StreamingSWARII, self).__init__(window_size=window_size, desired_frequency=desired_frequency)
+        self.reset()
+
+    def reset(self):
+        """Forget the previously acquired data points, in order to start a new signal."""
+
+        self.first_time = None
+        self.current_time = None
+        self.buffer_time = np.array([])
+        self.buffer_signal = None
+        self.signal_shape = ()
+
+    def update(self, time, signal):
+        """
+        Add a new chunk of the signal and resample it.
+
+        Input :
+            time:   The time stamps of the data points in the chunk, which must
+                    follow the ones of the previous chunks. A 1-d array of shape n.
+            signal: The data points of the chunk. A k-d array of shape (n,k).
+
+        Output:
+            resampled_time : The time stamps of the resampled points whose
+                             sliding window is complete
+            resampled_signal : The resampled points.
+        """
+
+        a_time = np.asarray(time, dtype=float)
+        a_signal = np.asarray(signal, dtype=float)
+
+        if a_time.size == 0:
+            return self.resampled_output(np.array([]), None)
+
+        if np.any(np.diff(a_time) < 0) or (self.buffer_time.size > 0 and a_time[0] < self.buffer_time[-1]):
+            raise ValueError("The time stamps of the streamed signal must be sorted in increasing order.")
+
+        if self.first_time is None:
+            self.first_time = a_time[0]
+            self.current_time = max(0., a_time[0])
+            self.signal_shape = a_signal.shape[1:]
+            self.buffer_signal = np.empty((0, int(np.prod(self.signal_shape))))
+
+        self.buffer_time = np.concatenate((self.buffer_time, a_time))
+        self.buffer_signal = np.concatenate((self.buffer_signal, a_signal.reshape(a_time.size, -1)))
+
+        # A sliding window is complete as soon as a data point lies after its right border
+        output_time = self.compute_pending_times(self.buffer_time[-1])
+        complete = self.buffer_time[-1] - output_time >= self.window_size * 0.5
+        output_time = output_time[:np.count_nonzero(complete)]
+
+        return self.resample_pending(output_time, np.inf)
+
+    def finish(self):
+        """
+        Resample the remaining points once the acquisition is over.
+
+        Output:
+            resampled_time : The time stamps of the remaining resampled points
+            resampled_signal : The remaining resampled points.
+        """
+
+        if self.buffer_time.size == 0:
+            return self.resampled_output(np.array([]), None)
+
+        last_time = self.buffer_time[-1]
+        output_time = self.compute_pending_times(last_time)
+        output_time = output_time[output_time < last_time]
+
+        output = self.resample_pending(output_time, last_time)
+        self.reset()
+
+        return output
+
+    def compute_pending_times(self, last_time):
+        """Compute the time stamps of the points that have not been resampled yet, up to the last known time stamp."""
+
+        number_of_samples = max(int(np.ceil((last_time - self.current_time) * self.desired_frequency)), 0) + 2
+        increments = np.full(number_of_samples, 1. / self.desired_frequency)
+        increments[0] = self.current_time
+
+        return np.cumsum(increments)
+
+    def resample_pending(self, output_time, last_time):
+        """Resample the signal at the given time stamps and drop the data points which are no longer needed."""
+
+        if output_time.size == 0:
+            return self.resampled_output(output_time, None)
+
+        output_signal = self.compute_weighted_averages(self.buffer_time, self.buffer_signal, output_time,
+                                                       self.first_time, last_time)
+
+        self.current_time = output_time[-1] + 1. / self.desired_frequency
+
+        # Keep only the data points which can still fall into a future sliding window
+        kept = np.count_nonzero(self.buffer_time - self.current_time <= -self.window_size * 0.5)
+        self.buffer_time = self.buffer_time[kept:]
+        self.buffer_signal = self.buffer_signal[kept:]
+
+        return self.resampled_output(output_time, output_signal)
+
+    def resampled_output(self, output_time, output_signal):
+        """Reshape the resampled points to the dimension of the input signal."""
+
+        if output_signal is None:
+            output_signal = np.empty((0,) + self.signal_shape)
+
+        return output_time, output_signal.reshape((output_time.size,) + self.signal_shape)
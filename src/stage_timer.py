@@ -0,0 +1,162 @@
+# Built-in modules imports
+from contextlib import contextmanager, nullcontext
+import functools
+import json
+import time
+
+# Third-party module imports
+import pandas as pd
+
+# Context of the stages of a disabled stage timer, shared by all the stages so that they cost almost nothing
+disabled_stage = nullcontext()
+
+
+def timed_stage(name):
+    """Decorate a method, of an object which has a stage timer, so that its calls are timed as a stage."""
+
+    def decorator(method):
+        @functools.wraps(method)
+        def timed_method(self, *args, **kwargs):
+            with self.stage_timer.stage(name):
+                return method(self, *args, **kwargs)
+
+        return timed_method
+
+    return decorator
+
+
+class StageTimer:
+    """
+    Timer of the processing stages of every file processed by a pipeline.
+
+    The stages are timed within the processing of a file, and the time of a stage excludes the time of the stages nested
+    in it, so that the stages times of a file add up to its processing time, apart from the untimed steps. Every processed
+    file gets a record of its total time and of the time of each of its stages, summed over the calls of the stage.
+
+    A disabled stage timer records nothing, and its stages are a shared empty context.
+    """
+
+    summary_statistics = ["count", "total", "mean", "p50", "p95", "max"]
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.records = []
+        self.stages_times = None
+        self.nested_times = []
+
+    def stage(self, name):
+        """Get the context in which a stage of the current file is timed."""
+
+        if not self.enabled:
+            return disabled_stage
+
+        return self.time_stage(name)
+
+    @contextmanager
+    def time_stage(self, name):
+        self.nested_times.append(0.)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_time = time.perf_counter() - start_time
+            nested_time = self.nested_times.pop()
+            if self.nested_times:
+                self.nested_times[-1] += elapsed_time
+
+            if self.stages_times is not None:
+                self.stages_times[name] = self.stages_times.get(name, 0.) + elapsed_time - nested_time
+
+    def file(self, filepath):
+        """Get the context in which the processing of a file is timed and recorded."""
+
+        if not self.enabled:
+            return disabled_stage
+
+        return self.time_file(filepath)
+
+    @contextmanager
+    def time_file(self, filepath):
+        self.stages_times = {}
+        self.nested_times = []
+        failed = True
+        start_time = time.perf_counter()
+        try:
+            yield
+            failed = False
+        finally:
+            record = {"filepath": filepath, "failed": failed, "total": time.perf_counter() - start_time}
+            self.records.append({**record, **self.stages_times})
+            self.stages_times = None
+
+    def record_stage(self, record, name):
+        """
+        Get the context in which a stage of an already recorded file is timed and added to its record, e.g a stage run by
+        the parent process for a file processed by a worker process.
+        """
+
+        if not self.enabled or record is None:
+            return disabled_stage
+
+        return self.time_record_stage(record, name)
+
+    @contextmanager
+    def time_record_stage(self, record, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            record["failed"] = True
+            raise
+        finally:
+            elapsed_time = time.perf_counter() - start_time
+            record[name] = record.get(name, 0.) + elapsed_time
+            record["total"] += elapsed_time
+
+    def pop_record(self):
+        """Remove and return the record of the last processed file, e.g to send it from a worker to the parent process."""
+
+        if not self.enabled or not self.records:
+            return None
+
+        return self.records.pop()
+
+    def add_record(self, record):
+        if self.enabled and record is not None:
+            self.records.append(record)
+
+    def get_records(self):
+        """Get the records of the processed files as a table, with a column per stage in seconds."""
+
+        return pd.DataFrame(self.records)
+
+    def summarize(self):
+        """Summarize the times of each stage, and of the whole processing, over the files in which they were timed."""
+
+        records = self.get_records()
+        stages = [column for column in records.columns if column not in ["filepath", "failed"]]
+
+        summary = pd.DataFrame(index=stages, columns=self.summary_statistics, dtype=float)
+        for stage in stages:
+            times = records[stage].dropna()
+            summary.loc[stage] = [len(times), times.sum(), times.mean(), times.quantile(0.5), times.quantile(0.95),
+                                  times.max()]
+
+        return summary.sort_values("total", ascending=False)
+
+    def save(self, filepath):
+        """
+        Save the records of the processed files to a csv or json file, according to its extension, and the summary of the
+        stages to a csv file next to it.
+        """
+
+        if filepath.endswith(".json"):
+            with open(filepath, "w") as records_file:
+                json.dump(self.records, records_file, indent=4)
+        else:
+            self.get_records().to_csv(filepath, index=False)
+
+        summary_filepath = "{}_summary.csv".format(filepath.rsplit(".", 1)[0])
+        self.summarize().to_csv(summary_filepath, index_label="stage")
+
+        return summary_filepath
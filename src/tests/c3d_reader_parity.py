@@ -0,0 +1,202 @@
+# Third-party module imports
+import logging
+import os
+import struct
+import sys
+import tempfile
+import timeit
+from argparse import ArgumentParser
+
+from context import *
+from parity_checks import check_parity, check_condition
+import numpy as np
+
+BLOCK_SIZE = 512
+
+
+def pack_parameter(name, group_id, element_size, dimensions, data, last=False):
+    """Pack a parameter record of the parameter section of a c3d file."""
+
+    body = struct.pack("<bB", element_size, len(dimensions)) + bytes(dimensions) + data + b"\x00"
+    offset = 0 if last else 2 + len(body)
+
+    return struct.pack("<bb", len(name), group_id) + name.encode() + struct.pack("<H", offset) + body
+
+
+def pack_group(name, group_id):
+    """Pack a group record of the parameter section of a c3d file."""
+
+    return struct.pack("<bb", len(name), -group_id) + name.encode() + struct.pack("<H", 3) + b"\x00"
+
+
+def pack_labels(labels, length):
+    return b"".join(label.ljust(length).encode() for label in labels)
+
+
+def write_c3d(filepath, points, point_labels, analog, analog_labels, point_rate, analog_per_frame, point_scale,
+              analog_scales, analog_offsets, general_scale, truncated_bytes=0):
+    """
+    Write a synthetic c3d file of the Intel processor type, whose data is stored as floats if the point scale is negative,
+    and else as integers.
+
+    The points are (frames x points x 3) coordinates, and the analog samples are (frames * analog_per_frame x channels)
+    raw values, before scaling.
+    """
+
+    frames, points_number = points.shape[:2]
+    analog_used = len(analog_labels)
+
+    parameters = b"".join([
+        pack_group("POINT", 1),
+        pack_group("ANALOG", 2),
+        pack_parameter("USED", 1, 2, [], struct.pack("<h", points_number)),
+        pack_parameter("SCALE", 1, 4, [], struct.pack("<f", point_scale)),
+        pack_parameter("RATE", 1, 4, [], struct.pack("<f", point_rate)),
+        pack_parameter("DATA_START", 1, 2, [], struct.pack("<h", 4)),
+        pack_parameter("LABELS", 1, -1, [16, points_number], pack_labels(point_labels, 16)),
+        pack_parameter("USED", 2, 2, [], struct.pack("<h", analog_used)),
+        pack_parameter("RATE", 2, 4, [], struct.pack("<f", point_rate * analog_per_frame)),
+        pack_parameter("GEN_SCALE", 2, 4, [], struct.pack("<f", general_scale)),
+        pack_parameter("SCALE", 2, 4, [analog_used], struct.pack("<{}f".format(analog_used), *analog_scales)),
+        pack_parameter("OFFSET", 2, 2, [analog_used], struct.pack("<{}h".format(analog_used), *analog_offsets)),
+        pack_parameter("LABELS", 2, -1, [12, analog_used], pack_labels(analog_labels, 12), last=True)])
+
+    # The parameter section takes the blocks 2 and 3, and the data section starts at block 4
+    parameter_section = (bytes([1, 0x50, 2, 84]) + parameters).ljust(2 * BLOCK_SIZE, b"\x00")
+    header = struct.pack("<BBHHHHHfHHf", 2, 0x50, points_number, analog_used * analog_per_frame, 1, frames, 0,
+                         point_scale, 4, analog_per_frame, point_rate).ljust(BLOCK_SIZE, b"\x00")
+
+    # Every frame holds the point coordinates with their residual, followed by the analog samples of the frame
+    is_float = point_scale < 0
+    residuals = np.zeros(points.shape[:2] + (1,))
+    if is_float:
+        point_data = np.concatenate([points, residuals], axis=2).astype("<f4")
+        analog_data = analog.astype("<f4")
+    else:
+        point_data = np.concatenate([np.round(points / abs(point_scale)), residuals], axis=2).astype("<i2")
+        analog_data = analog.astype("<i2")
+
+    analog_data = analog_data.reshape(frames, analog_per_frame * analog_used)
+    data = b"".join(point_data[frame].tobytes() + analog_data[frame].tobytes() for frame in range(frames))
+
+    with open(filepath, "wb") as c3d_file:
+        c3d_file.write(header + parameter_section + data[:len(data) - truncated_bytes])
+
+
+def check_acquisition(logger, name, acquisition, expected_points, point_labels, expected_analog, analog_labels,
+                      point_rate, analog_per_frame):
+    """Compare the channels of an acquisition, read with every reading method, with their expected values."""
+
+    results = [check_parity(logger, "{}: frequencies".format(name), [point_rate, point_rate * analog_per_frame],
+                            [acquisition.GetPointFrequency(), acquisition.GetAnalogFrequency()]),
+               check_parity(logger, "{}: frame numbers".format(name),
+                            [expected_points.shape[0], expected_analog.shape[0]],
+                            [acquisition.GetPointFrameNumber(), acquisition.GetAnalogFrameNumber()])]
+
+    point_data = HybridAcquisitionReader.get_point_data(acquisition, point_labels)
+    point_matrix = HybridAcquisitionReader.get_point_data(acquisition, point_labels, as_matrix=True)
+    for index, label in enumerate(point_labels):
+        results.append(check_parity(logger, "{}: point {}".format(name, label), expected_points[:, index],
+                                    point_data[label], tolerance=1e-4))
+        results.append(check_parity(logger, "{}: point {} read in a channel matrix".format(name, label),
+                                    expected_points[:, index], point_matrix[label], tolerance=1e-4))
+
+    analog_data = HybridAcquisitionReader.get_analog_data(acquisition, analog_labels)
+    analog_matrix = HybridAcquisitionReader.get_analog_data(acquisition, analog_labels, as_matrix=True)
+    for index, label in enumerate(analog_labels):
+        results.append(check_parity(logger, "{}: analog channel {}".format(name, label),
+                                    expected_analog[:, index:index + 1], analog_data[label], tolerance=1e-4))
+        results.append(check_parity(logger, "{}: analog channel {} read in a channel matrix".format(name, label),
+                                    expected_analog[:, index:index + 1], analog_matrix[label], tolerance=1e-4))
+
+    return all(results)
+
+
+def main():
+    ##################
+    # Boilerplate code
+    ##################
+
+    # Setup logger
+    setup_logging()
+    logger = logging.getLogger("tests")
+
+    # Command line argument parser
+    parser = ArgumentParser(
+        description="NumPy c3d reader parity checks on synthetic c3d files")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Seed of the synthetic acquisitions")
+    parser.add_argument("-b", "--btk", action='store_true',
+                        help="Also compare the NumPy reader with the biomechanical toolkit reader")
+    parser.add_argument("-d", "--debug", action='store_true', help="Enable debug mode")
+
+    args = parser.parse_args()
+    debug = args.debug
+
+    if debug:
+        logger.setLevel("DEBUG")
+
+    rng = np.random.default_rng(args.seed)
+
+    # Synthetic acquisition of 2 points and 5 analog channels, like the force plate ones
+    frames, point_rate, analog_per_frame = 500, 100., 10
+    point_labels = ["Accelerometer", "Marker"]
+    analog_labels = HybridAcquisitionReader.force_plate_analog_labels
+    points = np.round(rng.uniform(-1000, 1000, size=(frames, len(point_labels), 3)))
+    analog = np.round(rng.uniform(-2000, 2000, size=(frames * analog_per_frame, len(analog_labels))))
+    analog_scales = rng.uniform(0.1, 2, size=len(analog_labels))
+    analog_offsets = rng.integers(-100, 100, size=len(analog_labels))
+    general_scale = 0.5
+
+    ##################
+    # Tests
+    ##################
+
+    logger.info("Comparing the channels read by the NumPy c3d reader with the ones written to synthetic c3d files.")
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as folder:
+        c3d_files = []
+        for name, point_scale, truncated_bytes in [("float file", -0.1, 0), ("integer file", 0.5, 0),
+                                                   ("truncated float file", -0.1, 1000)]:
+            filepath = os.path.join(folder, "{}.c3d".format(name.replace(" ", "_")))
+            write_c3d(filepath, points, point_labels, analog, analog_labels, point_rate, analog_per_frame, point_scale,
+                      analog_scales, analog_offsets, general_scale, truncated_bytes)
+            c3d_files.append(filepath)
+
+            # The analog values are scaled as specified by the c3d format, and only the complete frames are read
+            expected_analog = (analog - analog_offsets) * analog_scales * general_scale
+            acquisition = C3DAcquisition(filepath)
+            complete_frames = acquisition.GetPointFrameNumber()
+            results.append(check_condition(logger, "{}: truncation detected".format(name),
+                                           acquisition.is_truncated() == (truncated_bytes > 0)))
+            results.append(check_acquisition(logger, name, acquisition, points[:complete_frames], point_labels,
+                                             expected_analog[:complete_frames * analog_per_frame], analog_labels,
+                                             point_rate, analog_per_frame))
+
+        if args.btk:
+            logger.info("Comparing the channels read by the NumPy c3d reader and by the biomechanical toolkit reader.")
+            data_reader = HybridAcquisitionReader()
+            data_reader.backend = "btk"
+            for filepath in c3d_files[:2]:
+                acquisition = C3DAcquisition(filepath)
+                btk_acquisition = data_reader.read_acquisition(filepath)
+                for label in point_labels:
+                    results.append(check_parity(logger, "{}: btk point {}".format(filepath, label),
+                                                btk_acquisition.GetPoint(label).GetValues(),
+                                                acquisition.GetPoint(label).GetValues(), tolerance=1e-4))
+                for label in analog_labels:
+                    results.append(check_parity(logger, "{}: btk analog channel {}".format(filepath, label),
+                                                btk_acquisition.GetAnalog(label).GetValues(),
+                                                acquisition.GetAnalog(label).GetValues(), tolerance=1e-4))
+
+    return all(results)
+
+
+if __name__ == "__main__":
+    start = timeit.default_timer()
+    passed = main()
+    stop = timeit.default_timer()
+
+    print('Execution time: {} seconds'.format(stop - start))
+    sys.exit(0 if passed else 1)
@@ -12,3 +12,10 @@ from utils import load_config, setup_logging, plot_stabilograms, plot_spectral_d
     plot_superposed_spectral_densities
 from feature_extraction_pipeline import FeatureExtractionPipeline
 from preprocessing_pipeline import PreprocessingPipeline
+from resampling import SWARII, StreamingSWARII
+from fourier_resampling import PairedFourierResampler
+from c3d_reader import C3DAcquisition
+from raw_data_cache import RawDataCache
+from channel_matrix import ChannelMatrix
+from cop_data_store import CopDataStore
+from processing_manifest import ProcessingManifest
@@ -0,0 +1,119 @@
+# Third-party module imports
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import timeit
+from argparse import ArgumentParser
+
+from context import *
+from parity_checks import check_parity, check_condition
+import numpy as np
+
+
+def check_store(logger, name, cop_data_store, trials):
+    """Compare the COP data of every trial of the store, read by key and in the order of the store, with its last version."""
+
+    results = [check_condition(logger, "{}: trials".format(name), sorted(cop_data_store.keys()) == sorted(trials))]
+
+    for key, (cop_x, cop_y) in trials.items():
+        stored_cop_x, stored_cop_y = cop_data_store.get(key)
+        results.append(check_parity(logger, "{}: {}".format(name, os.path.basename(key)),
+                                    np.concatenate([cop_x, cop_y]), np.concatenate([stored_cop_x, stored_cop_y]),
+                                    tolerance=0))
+        results.append(check_condition(logger, "{}: hash of {}".format(name, os.path.basename(key)),
+                                       cop_data_store.get_hash(key) ==
+                                       hashlib.sha1(np.concatenate([cop_x, cop_y]).tobytes()).hexdigest()))
+
+    iterated_trials = {key: np.concatenate([cop_x, cop_y]) for key, cop_x, cop_y in cop_data_store.iterate()}
+    results.append(check_condition(logger, "{}: iteration".format(name), all(
+        np.array_equal(iterated_trials[key], np.concatenate(cop_data)) for key, cop_data in trials.items())))
+
+    return all(results)
+
+
+def main():
+    ##################
+    # Boilerplate code
+    ##################
+
+    # Setup logger
+    setup_logging()
+    logger = logging.getLogger("tests")
+
+    # Command line argument parser
+    parser = ArgumentParser(
+        description="COP data store parity checks on synthetic COP data")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Seed of the synthetic COP data")
+    parser.add_argument("-d", "--debug", action='store_true', help="Enable debug mode")
+
+    args = parser.parse_args()
+    debug = args.debug
+
+    if debug:
+        logger.setLevel("DEBUG")
+
+    rng = np.random.default_rng(args.seed)
+
+    def generate_cop_data():
+        samples = rng.integers(1000, 3000)
+        return rng.standard_normal(samples), rng.standard_normal(samples)
+
+    ##################
+    # Tests
+    ##################
+
+    logger.info("Comparing the COP data read from the COP data store with the last version of every trial.")
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as folder:
+        store_folder = os.path.join(folder, "cop_data_store")
+        keys = [os.path.join(folder, "cop_data", "Repro1", device, "1_{}_cop.json".format(trial))
+                for device in ["BB", "FP"] for trial in range(1, 6)]
+
+        cop_data_store = CopDataStore(store_folder)
+        trials = {}
+        for key in keys:
+            trials[key] = generate_cop_data()
+            cop_data_store.append(key, *trials[key], 100)
+
+        # A reader opened before the trials are stored again must not read them at their superseded offsets
+        reader = CopDataStore(store_folder)
+        results.append(check_store(logger, "Stored trials", reader, trials))
+
+        for key in keys[::2]:
+            trials[key] = generate_cop_data()
+            cop_data_store.append(key, *trials[key], 100)
+        results.append(check_store(logger, "Trials stored again", reader, trials))
+
+        # Half of the trials are superseded, so the store is compacted when it is closed
+        cop_data_store.close()
+        data_size = os.path.getsize(os.path.join(store_folder, CopDataStore.data_filename))
+        results.append(check_condition(logger, "Compacted binary file size", data_size == sum(
+            2 * cop_x.size * CopDataStore.dtype.itemsize for cop_x, _ in trials.values())))
+        results.append(check_store(logger, "Compacted store", reader, trials))
+
+        # A compaction interrupted before the compacted files replace the current ones is completed by the next reader
+        for key in keys[1::2]:
+            trials[key] = generate_cop_data()
+            cop_data_store.append(key, *trials[key], 100)
+        interrupted_store = CopDataStore(store_folder)
+        interrupted_store.complete_compaction = lambda: None
+        with interrupted_store.locked():
+            interrupted_store.compact(interrupted_store.read_index())
+        results.append(check_store(logger, "Interrupted compaction completed", CopDataStore(store_folder), trials))
+        results.append(check_condition(logger, "No compaction files left", not any(
+            filename.endswith(CopDataStore.compaction_extension) for filename in os.listdir(store_folder))))
+
+    return all(results)
+
+
+if __name__ == "__main__":
+    start = timeit.default_timer()
+    passed = main()
+    stop = timeit.default_timer()
+
+    print('Execution time: {} seconds'.format(stop - start))
+    sys.exit(0 if passed else 1)
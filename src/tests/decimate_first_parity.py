@@ -0,0 +1,83 @@
+# Third-party module imports
+import logging
+import timeit
+from argparse import ArgumentParser
+
+from context import *
+
+
+def main():
+    ##################
+    # Boilerplate code
+    ##################
+
+    # Load configuration file
+    config = load_config()
+
+    # Setup logger
+    setup_logging()
+    logger = logging.getLogger("tests")
+
+    # Force plate data test file
+    filepath_fp = config["test_files"]["fp_raw_data"]
+
+    # Command line argument parser
+    parser = ArgumentParser(
+        description="Decimate first force plate preprocessing parity study")
+    parser.add_argument("-f", "--frequency", action='store_true', help="Compare frequency features")
+    parser.add_argument("-d", "--debug", action='store_true', help="Enable debug mode")
+
+    args = parser.parse_args()
+    frequency = args.frequency
+    debug = args.debug
+
+    if debug:
+        logger.setLevel("DEBUG")
+
+    # Create a sensor data reader object
+    data_reader = HybridAcquisitionReader()
+
+    # Create a data preprocessor object
+    data_preprocessor = DataPreprocessor()
+
+    ##################
+    # Tests
+    ##################
+
+    logger.info("Comparing the force plate preprocessing with and without decimating the sensor values first.")
+    logger.info("Test file: {}".format(filepath_fp))
+
+    raw_data = data_reader.get_raw_data(filepath=filepath_fp)
+
+    reference_cop_data, decimate_first_cop_data, report = data_preprocessor.compute_decimate_first_parity(raw_data)
+
+    for key, value in report.items():
+        logger.info("{}: {}".format(key, value))
+
+    # Feature level differences
+    features_classes = [TimeFeatures, FrequencyFeatures] if frequency else [TimeFeatures]
+    for features_class in features_classes:
+        reference_features = features_class(reference_cop_data["COP_x"], reference_cop_data["COP_y"])
+        decimate_first_features = features_class(decimate_first_cop_data["COP_x"], decimate_first_cop_data["COP_y"])
+
+        attribute = "time_features" if features_class is TimeFeatures else "frequency_features"
+        reference_values = getattr(reference_features, attribute)
+        decimate_first_values = getattr(decimate_first_features, attribute)
+
+        for key, reference_value in reference_values.items():
+            difference = abs(decimate_first_values[key] - reference_value)
+            # The absolute difference is reported for the null reference values
+            if reference_value == 0:
+                logger.info("{}: reference {}, decimate first {}, absolute difference {}".format(
+                    key, reference_value, decimate_first_values[key], difference))
+            else:
+                logger.info("{}: reference {}, decimate first {}, relative difference {:.2%}".format(
+                    key, reference_value, decimate_first_values[key], difference / abs(reference_value)))
+
+
+if __name__ == "__main__":
+    start = timeit.default_timer()
+    main()
+    stop = timeit.default_timer()
+
+    print('Execution time: {} seconds'.format(stop - start))
@@ -0,0 +1,64 @@
+# Third-party module imports
+import logging
+import sys
+import timeit
+from argparse import ArgumentParser
+
+from context import *
+from parity_checks import check_parity
+import numpy as np
+import scipy.signal
+
+
+def main():
+    ##################
+    # Boilerplate code
+    ##################
+
+    # Setup logger
+    setup_logging()
+    logger = logging.getLogger("tests")
+
+    # Command line argument parser
+    parser = ArgumentParser(
+        description="Paired complex FFT resampling parity checks on synthetic signals")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Seed of the synthetic signals")
+    parser.add_argument("-d", "--debug", action='store_true', help="Enable debug mode")
+
+    args = parser.parse_args()
+    debug = args.debug
+
+    if debug:
+        logger.setLevel("DEBUG")
+
+    rng = np.random.default_rng(args.seed)
+
+    ##################
+    # Tests
+    ##################
+
+    logger.info("Comparing the paired complex FFT resampling with scipy.signal.resample.")
+
+    results = []
+
+    # Prime, odd, even and fast FFT numbers of samples, downsampled and upsampled to odd and even numbers of samples
+    for input_samples, output_samples in [(10007, 1000), (10007, 1001), (4001, 8002), (4000, 401), (4096, 1024),
+                                          (999, 1000)]:
+        # Even and odd numbers of channels, and a single channel
+        for channels_shape in [(5,), (2, 3), (1,), ()]:
+            input_signal = rng.standard_normal((input_samples,) + channels_shape)
+            reference_signal = scipy.signal.resample(input_signal, output_samples, axis=0)
+            paired_signal = PairedFourierResampler.resample(input_signal, output_samples)
+            results.append(check_parity(logger, "Resampling of {} samples of shape {} to {} samples".format(
+                input_samples, channels_shape, output_samples), reference_signal, paired_signal, tolerance=1e-12))
+
+    return all(results)
+
+
+if __name__ == "__main__":
+    start = timeit.default_timer()
+    passed = main()
+    stop = timeit.default_timer()
+
+    print('Execution time: {} seconds'.format(stop - start))
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,40 @@
+# Third-party module imports
+import numpy as np
+
+
+def check_parity(logger, name, reference, candidate, tolerance=1e-9):
+    """
+    Compare the output of a fast path with the one of its reference implementation, log their maximum absolute difference
+    and return whether it is within the tolerance. The missing values, i.e NaN, must be missing in both outputs.
+    """
+
+    a_reference = np.asarray(reference, dtype=float)
+    a_candidate = np.asarray(candidate, dtype=float)
+
+    if a_reference.shape != a_candidate.shape:
+        logger.error("{}: FAILED, shape {} instead of {}".format(name, a_candidate.shape, a_reference.shape))
+        return False
+
+    missing = np.isnan(a_reference)
+    if np.any(missing != np.isnan(a_candidate)):
+        logger.error("{}: FAILED, the missing values differ".format(name))
+        return False
+
+    difference = np.max(np.abs(a_reference - a_candidate)[~missing], initial=0.)
+    if difference > tolerance:
+        logger.error("{}: FAILED, maximum absolute difference {:.3g}".format(name, difference))
+        return False
+
+    logger.info("{}: passed, maximum absolute difference {:.3g}".format(name, difference))
+    return True
+
+
+def check_condition(logger, name, condition):
+    """Log whether a condition of a parity check holds, and return it."""
+
+    if not condition:
+        logger.error("{}: FAILED".format(name))
+        return False
+
+    logger.info("{}: passed".format(name))
+    return True
@@ -0,0 +1,117 @@
+# Third-party module imports
+import logging
+import os
+import sys
+import tempfile
+import timeit
+from argparse import ArgumentParser
+
+from context import *
+from parity_checks import check_condition
+import numpy as np
+
+
+def build_output_filepath(filepath):
+    return filepath + ".out"
+
+
+def main():
+    ##################
+    # Boilerplate code
+    ##################
+
+    # Setup logger
+    setup_logging()
+    logger = logging.getLogger("tests")
+
+    # Command line argument parser
+    parser = ArgumentParser(
+        description="Processing manifest checks on synthetic input and output files")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Seed of the synthetic files")
+    parser.add_argument("-d", "--debug", action='store_true', help="Enable debug mode")
+
+    args = parser.parse_args()
+    debug = args.debug
+
+    if debug:
+        logger.setLevel("DEBUG")
+
+    rng = np.random.default_rng(args.seed)
+
+    # Sources and configuration sections of the outputs, e.g of the feature extraction
+    source_modules = FeatureExtractionPipeline.output_modules
+    config_sections = FeatureExtractionPipeline.output_config_sections
+
+    ##################
+    # Tests
+    ##################
+
+    logger.info("Comparing the files selected by the processing manifest with the files whose outputs are outdated.")
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as folder:
+        manifest_filepath = os.path.join(folder, "processing_manifest.json")
+        input_filepaths = [os.path.join(folder, "1_{}_cop.json".format(trial)) for trial in range(1, 7)]
+        for filepath in input_filepaths:
+            with open(filepath, "wb") as input_file:
+                input_file.write(rng.bytes(1024))
+
+        def process(manifest, filepaths, failed_filepaths=()):
+            """Select the outdated files, write the outputs of the processed ones and record them in the manifest."""
+
+            keys, outdated_filepaths = manifest.select_outdated_files(filepaths, build_output_filepath, config_sections)
+            for filepath in outdated_filepaths:
+                if filepath not in failed_filepaths:
+                    open(build_output_filepath(filepath), "w").close()
+            manifest.record_processed_files(keys, outdated_filepaths, failed_filepaths, build_output_filepath)
+
+            return outdated_filepaths
+
+        manifest = ProcessingManifest(manifest_filepath, source_modules)
+        results.append(check_condition(logger, "All the files processed by the first run",
+                                       process(manifest, input_filepaths, input_filepaths[:1]) == input_filepaths))
+
+        # The manifest is loaded again like by the next run of the pipeline
+        manifest = ProcessingManifest(manifest_filepath, source_modules)
+        results.append(check_condition(logger, "Only the failed file processed again",
+                                       process(manifest, input_filepaths) == input_filepaths[:1]))
+        results.append(check_condition(logger, "No file processed when all are up to date",
+                                       process(manifest, input_filepaths) == []))
+
+        with open(input_filepaths[1], "ab") as input_file:
+            input_file.write(b"\x00")
+        os.remove(build_output_filepath(input_filepaths[2]))
+        results.append(check_condition(logger, "Modified input and missing output processed again",
+                                       process(manifest, input_filepaths) == input_filepaths[1:3]))
+
+        results.append(check_condition(logger, "All the files processed again when the configuration changes",
+                                       manifest.select_outdated_files(input_filepaths, build_output_filepath,
+                                                                      config_sections[1:])[1] == input_filepaths))
+
+        other_manifest = ProcessingManifest(manifest_filepath, PreprocessingPipeline.output_modules)
+        results.append(check_condition(logger, "All the files processed again when the source modules change",
+                                       other_manifest.select_outdated_files(input_filepaths, build_output_filepath,
+                                                                            config_sections)[1] == input_filepaths))
+
+        # Inputs identified by the keys of a COP data store, whose hashes change when the trials are stored again
+        cop_data_store = CopDataStore(os.path.join(folder, "cop_data_store"))
+        for filepath in input_filepaths:
+            cop_data_store.append(filepath, rng.standard_normal(100), rng.standard_normal(100), 100)
+        store_manifest = ProcessingManifest(os.path.join(folder, "store_manifest.json"), source_modules,
+                                            compute_input_hash=cop_data_store.get_hash)
+        process(store_manifest, input_filepaths)
+        cop_data_store.append(input_filepaths[3], rng.standard_normal(100), rng.standard_normal(100), 100)
+        results.append(check_condition(logger, "Trial stored again processed again",
+                                       process(store_manifest, input_filepaths) == input_filepaths[3:4]))
+
+    return all(results)
+
+
+if __name__ == "__main__":
+    start = timeit.default_timer()
+    passed = main()
+    stop = timeit.default_timer()
+
+    print('Execution time: {} seconds'.format(stop - start))
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,116 @@
+# Third-party module imports
+import logging
+import os
+import sys
+import tempfile
+import timeit
+from argparse import ArgumentParser
+
+from context import *
+from parity_checks import check_parity, check_condition
+import numpy as np
+
+
+def main():
+    ##################
+    # Boilerplate code
+    ##################
+
+    # Setup logger
+    setup_logging()
+    logger = logging.getLogger("tests")
+
+    # Command line argument parser
+    parser = ArgumentParser(
+        description="Raw data cache parity checks on synthetic raw data")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Seed of the synthetic raw data")
+    parser.add_argument("-d", "--debug", action='store_true', help="Enable debug mode")
+
+    args = parser.parse_args()
+    debug = args.debug
+
+    if debug:
+        logger.setLevel("DEBUG")
+
+    rng = np.random.default_rng(args.seed)
+
+    # Synthetic raw data of a force plate and of a WBB acquisition, whose files only need to exist to be hashed
+    labels = HybridAcquisitionReader.force_plate_analog_labels
+    fp_raw_data = {label: rng.standard_normal((10000, 1)) for label in labels}
+    wbb_raw_data = [np.cumsum(rng.uniform(0.005, 0.015, size=2000)), {"Accelerometer": rng.standard_normal((2000, 3))}]
+    matrix_raw_data = ChannelMatrix(np.column_stack([fp_raw_data[label] for label in labels]),
+                                    {label: slice(index, index + 1) for index, label in enumerate(labels)})
+
+    ##################
+    # Tests
+    ##################
+
+    logger.info("Comparing the raw data served by the raw data cache with the raw data it stored.")
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as folder:
+        acquisition_filepath = os.path.join(folder, "1_1.c3d")
+        with open(acquisition_filepath, "wb") as acquisition_file:
+            acquisition_file.write(rng.bytes(4096))
+
+        raw_data_cache = RawDataCache(os.path.join(folder, "raw_data_cache"), max_size=2 ** 30)
+        reads = []
+
+        def read_raw_data(raw_data):
+            """Get a function which reads the given raw data, and counts the reads of the acquisition file."""
+
+            def read():
+                reads.append(acquisition_filepath)
+                return raw_data
+
+            return read
+
+        # The raw data is read once, and then served from the cache
+        for name, raw_data, balance_board, as_matrix in [("force plate", fp_raw_data, False, False),
+                                                         ("force plate matrix", matrix_raw_data, False, True),
+                                                         ("WBB", wbb_raw_data, True, False)]:
+            channels = raw_data[1] if balance_board else raw_data
+            channel_labels = list(channels.keys())
+            reads.clear()
+            for attempt in ["cache miss", "cache hit"]:
+                cached_raw_data = raw_data_cache.get(acquisition_filepath, read_raw_data(raw_data), channel_labels,
+                                                     channel_labels, balance_board, as_matrix)
+                cached_channels = cached_raw_data[1] if balance_board else cached_raw_data
+                for label in channel_labels:
+                    results.append(check_parity(logger, "{} {}: channel {}".format(name, attempt, label),
+                                                channels[label], cached_channels[label], tolerance=0))
+                if balance_board:
+                    results.append(check_parity(logger, "{} {}: timestamps".format(name, attempt), raw_data[0],
+                                                cached_raw_data[0], tolerance=0))
+            results.append(check_condition(logger, "{}: acquisition file read once".format(name), len(reads) == 1))
+
+        # The entries of the different reader backends are kept apart
+        reads.clear()
+        raw_data_cache.get(acquisition_filepath, read_raw_data(fp_raw_data), labels, labels, backend="numpy")
+        results.append(check_condition(logger, "Reader backends kept apart", len(reads) == 1))
+
+        # A modified acquisition file is read again
+        reads.clear()
+        with open(acquisition_filepath, "ab") as acquisition_file:
+            acquisition_file.write(b"\x00")
+        raw_data_cache.get(acquisition_filepath, read_raw_data(fp_raw_data), labels, labels)
+        results.append(check_condition(logger, "Modified acquisition file read again", len(reads) == 1))
+
+        # The least recently used entries are evicted once the cache is full, i.e all but the last used one here
+        last_entry = raw_data_cache.compute_key(acquisition_filepath, labels)
+        raw_data_cache.max_size = raw_data_cache.compute_folder_size(os.path.join(raw_data_cache.folder, last_entry))
+        raw_data_cache.evict()
+        entries = [entry for entry in os.listdir(raw_data_cache.folder) if not entry.startswith(".")]
+        results.append(check_condition(logger, "Least recently used entries evicted", entries == [last_entry]))
+
+    return all(results)
+
+
+if __name__ == "__main__":
+    start = timeit.default_timer()
+    passed = main()
+    stop = timeit.default_timer()
+
+    print('Execution time: {} seconds'.format(stop - start))
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,113 @@
+# Third-party module imports
+import logging
+import sys
+import timeit
+from argparse import ArgumentParser
+
+from context import *
+from parity_checks import check_parity
+import numpy as np
+
+
+def generate_wbb_signal(rng, duration, mean_period):
+    """Generate the irregular timestamps and the two COP channels of a synthetic WBB acquisition."""
+
+    periods = mean_period * (0.5 + rng.exponential(0.5, size=int(duration / mean_period)))
+    time = np.cumsum(periods) - periods[0]
+    signal = np.column_stack([np.sin(2 * np.pi * 0.3 * time), np.cos(2 * np.pi * 0.7 * time)])
+    signal += 0.1 * rng.standard_normal(signal.shape)
+
+    return time, signal
+
+
+def main():
+    ##################
+    # Boilerplate code
+    ##################
+
+    # Load configuration file
+    config = load_config()
+
+    # Setup logger
+    setup_logging()
+    logger = logging.getLogger("tests")
+
+    # SWARII parameters
+    window_size = config["preprocessing_parameters"]["swarii_window_size"]
+    desired_frequency = config["preprocessing_parameters"]["acquisition_frequency"]
+
+    # Command line argument parser
+    parser = ArgumentParser(
+        description="SWARII fast paths parity checks on synthetic WBB signals")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Seed of the synthetic signals")
+    parser.add_argument("--duration", type=float, default=20, help="Duration of the synthetic signals in seconds")
+    parser.add_argument("-d", "--debug", action='store_true', help="Enable debug mode")
+
+    args = parser.parse_args()
+    debug = args.debug
+
+    if debug:
+        logger.setLevel("DEBUG")
+
+    rng = np.random.default_rng(args.seed)
+    time, signal = generate_wbb_signal(rng, args.duration, 0.01)
+    swarii = SWARII(window_size=window_size, desired_frequency=desired_frequency)
+
+    ##################
+    # Tests
+    ##################
+
+    logger.info("Synthetic WBB signal of {} samples, SWARII window size {} s, resampled at {} Hz".format(
+        time.size, window_size, desired_frequency))
+
+    results = []
+
+    reference_time, reference_signal = swarii.resample(time, signal)
+
+    # Vectorized SWARII on the two channels, on a single channel and on a slice of the output
+    fast_time, fast_signal = swarii.fast_resample(time, signal)
+    results.append(check_parity(logger, "Vectorized SWARII time stamps", reference_time, fast_time))
+    results.append(check_parity(logger, "Vectorized SWARII", reference_signal, fast_signal))
+
+    _, fast_channel = swarii.fast_resample(time, signal[:, 0])
+    results.append(check_parity(logger, "Vectorized SWARII on a single channel", reference_signal[:, 0], fast_channel))
+
+    output_slice = slice(reference_time.size // 4, reference_time.size // 2)
+    _, fast_slice = swarii.fast_resample(time, signal, output_slice=output_slice)
+    results.append(check_parity(logger, "Vectorized SWARII on an output slice", reference_signal[output_slice],
+                                fast_slice))
+
+    # Streaming SWARII on chunks of random sizes, including empty chunks
+    streaming_swarii = StreamingSWARII(window_size=window_size, desired_frequency=desired_frequency)
+    chunk_bounds = np.concatenate([[0], np.sort(rng.integers(0, time.size, size=20)), [time.size]])
+    chunk_bounds = np.insert(chunk_bounds, 10, chunk_bounds[10])
+    chunks = [slice(chunk_start, chunk_stop) for chunk_start, chunk_stop in zip(chunk_bounds[:-1], chunk_bounds[1:])]
+    outputs = [streaming_swarii.update(time[chunk], signal[chunk]) for chunk in chunks]
+    outputs.append(streaming_swarii.finish())
+    results.append(check_parity(logger, "Streaming SWARII time stamps", reference_time,
+                                np.concatenate([output_time for output_time, _ in outputs])))
+    results.append(check_parity(logger, "Streaming SWARII", reference_signal,
+                                np.concatenate([output_signal for _, output_signal in outputs])))
+
+    # Window sizes sweep, whose too small window sizes give missing values instead of failing
+    window_sizes = [0.001, 0.1, window_size, 1.5]
+    _, sweep_signals = swarii.sweep_window_sizes(time, signal, window_sizes)
+    for sweep_window_size, sweep_signal in zip(window_sizes, sweep_signals):
+        try:
+            _, window_reference_signal = SWARII(window_size=sweep_window_size,
+                                                desired_frequency=desired_frequency).resample(time, signal)
+        except AssertionError:
+            window_reference_signal = np.full(reference_signal.shape, np.nan)
+        results.append(check_parity(logger, "SWARII sweep with a window size of {} s".format(sweep_window_size),
+                                    window_reference_signal, sweep_signal))
+
+    return all(results)
+
+
+if __name__ == "__main__":
+    start = timeit.default_timer()
+    passed = main()
+    stop = timeit.default_timer()
+
+    print('Execution time: {} seconds'.format(stop - start))
+    sys.exit(0 if passed else 1)
@@ -45,17 +45,15 @@ def main():
     data_reader = HybridAcquisitionReader()
 
     # Create a data preprocessor object
-    data_preprocessors = [DataPreprocessor() for i in range(len(swarii_time_windows))]
+    data_preprocessor = DataPreprocessor()
 
-    for (dp, time_window) in zip(data_preprocessors, swarii_time_windows):
-        logger.info("Swarii time window: {}".format(time_window))
-        dp.use_swarii = True
-        dp.window_size = time_window
+    logger.info("Swarii time windows: {}".format(swarii_time_windows))
 
     # Get raw data
     raw_data = data_reader.get_raw_data(filepath=filepath_wbb, balance_board=True)
 
-    preprocessed_cop_data_swariis = [dp.preprocess_raw_data(raw_data, True) for dp in data_preprocessors]
+    preprocessed_cop_data_swariis = data_preprocessor.preprocess_raw_data_swarii_window_sizes(raw_data,
+                                                                                               swarii_time_windows)
     for preprocessed_cop_data in preprocessed_cop_data_swariis:
         for key in preprocessed_cop_data:
             preprocessed_cop_data[key] *= scale_factor
@@ -1,9 +1,12 @@
 # Third-party module imports
+import hashlib
 import json
 import numpy as np
 import os
 import logging.config
+import struct
 import sys
+import zipfile
 from matplotlib import pyplot as plt, gridspec
 
 logger = logging.getLogger("utils")
@@ -49,22 +52,95 @@ def save_as_json(data, filepath, folder_to_replace, destination_folder, name_ext
         json.dump(data, outfile, cls=NumpyEncoder, sort_keys=False, indent=4, ensure_ascii=False)
 
 
+def save_as_npz(data, filepath, folder_to_replace, destination_folder, name_extension):
+    """Save results to uncompressed npz format, whose arrays can be memory mapped."""
+
+    filename = build_filename(filepath, folder_to_replace, destination_folder, name_extension)
+    np.savez(filename, **data)
+
+
+def load_npz(filepath, mmap_mode=None):
+    """
+    Load the arrays of an uncompressed npz file, which are memory mapped from the file itself if a memory mapping mode is
+    given.
+    """
+
+    if mmap_mode is None:
+        with np.load(filepath) as npz_file:
+            return {name: npz_file[name] for name in npz_file.files}
+
+    arrays = {}
+    with zipfile.ZipFile(filepath) as zip_file, open(filepath, "rb") as file:
+        for member in zip_file.infolist():
+            if member.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("Compressed npz file can not be memory mapped: {}".format(filepath))
+
+            # The .npy file of the member follows its local file header, whose size depends on the name and extra fields
+            file.seek(member.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", file.read(4))
+            file.seek(member.header_offset + 30 + name_length + extra_length)
+
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+
+            name = os.path.splitext(member.filename)[0]
+            if shape:
+                arrays[name] = np.memmap(filepath, dtype=dtype, mode=mmap_mode, offset=file.tell(), shape=shape,
+                                         order="F" if fortran_order else "C")
+            else:
+                arrays[name] = np.fromfile(file, dtype=dtype, count=1).reshape(())
+
+    return arrays
+
+
 def build_filename(input_file, folder_to_replace, destination_folder, name_extension):
-    """Build a custom destination filepath from the input file."""
+    """Build a custom destination filepath from the input file, and create its folder."""
 
-    base_name = os.path.splitext(input_file)[0]
-    filename = base_name.replace(folder_to_replace, destination_folder) + "{}".format(name_extension)
+    filename = build_filepath(input_file, folder_to_replace, destination_folder, name_extension)
     dir_name = os.path.dirname(filename)
     check_folder(dir_name)
 
     return filename
 
 
+def build_filepath(input_file, folder_to_replace, destination_folder, name_extension):
+    """Build a custom destination filepath from the input file, without creating its folder."""
+
+    base_name = os.path.splitext(input_file)[0]
+
+    return base_name.replace(folder_to_replace, destination_folder) + "{}".format(name_extension)
+
+
+def compute_file_hash(filepath, chunk_size=1 << 20):
+    """Compute the hash of the content of a file."""
+
+    file_hash = hashlib.sha1()
+    with open(filepath, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+def compute_code_version(module_names):
+    """Compute the version of the code of the given modules of the pipelines, as the hash of their source files."""
+
+    source_folder = os.path.dirname(os.path.abspath(__file__))
+    code_hash = hashlib.sha1()
+    for module_name in sorted(module_names):
+        code_hash.update(compute_file_hash(os.path.join(source_folder, "{}.py".format(module_name))).encode())
+
+    return code_hash.hexdigest()
+
+
 def check_folder(folder_name):
     """Check if a folder exists, and if not, create it."""
 
-    if not os.path.exists(folder_name):
-        os.makedirs(folder_name)
+    # The folder may be created concurrently by the parallel workers of the pipelines
+    os.makedirs(folder_name, exist_ok=True)
 
 
 def check_folders(folders):
@@ -107,6 +183,30 @@ def separate_files(files):
     return wbb_files_curated, fp_files_curated
 
 
+def parse_trial_info(file):
+    """Parse the filepath to retrieve information that allows to identify the acquisition"""
+
+    FP = "FP"
+    WBB = "BB"
+    keys = ["device", "subject", "trial", "balance board"]
+    trial_info = dict.fromkeys(keys)
+    trial_info["device"] = FP if FP in file else WBB
+
+    pre_subject_substring = "Repro"
+    pre_subject_substring_index = file.find(pre_subject_substring)
+    trial_info["subject"] = file[pre_subject_substring_index + len(pre_subject_substring)]
+
+    pre_balance_board_substring = trial_info["device"] + "/"
+    pre_balance_board_substring_index = file.find(pre_balance_board_substring)
+    trial_info["balance board"] = file[pre_balance_board_substring_index + len(pre_balance_board_substring)]
+
+    pre_trial_substring = pre_balance_board_substring + trial_info["balance board"] + "_"
+    pre_trial_substring_index = file.find(pre_trial_substring)
+    trial_info["trial"] = file[pre_trial_substring_index + len(pre_trial_substring)]
+
+    return trial_info
+
+
 def setup_logging(default_level=logging.INFO):
     """Setup the logging module configuration from configuration file."""
 
@@ -191,9 +291,7 @@ def plot_stabilograms(preprocessed_cop_data, device_name, acq_frequency, filepat
 
     # Save the plots
     if filepath:
-        config = load_config()
-        swarii_window = config["preprocessing_parameters"]["swarii_window_size"]
-        fig_name = build_filename(filepath, folder_to_replace="BalanceBoard/Repro", destination_folder="results/cop_plots", name_extension="_SWARII_{}.png".format(swarii_window))
+        fig_name = build_stabilograms_filename(filepath)
         plt.savefig(fig_name, bbox_inches='tight')
         plt.close(fig)
 
@@ -274,11 +372,28 @@ def plot_spectral_densities(frequencies, spectrums, filepath=None):
 
     # Save the plots
     if filepath:
-        fig_name = build_filename(filepath, folder_to_replace="cop_data", destination_folder="spectrum_plots", name_extension="_spectrum.png")
+        fig_name = build_spectral_densities_filename(filepath)
         plt.savefig(fig_name, bbox_inches='tight')
         plt.close(fig)
 
 
+def build_stabilograms_filename(filepath):
+    """Build the path of the stabilograms plot of an acquisition file, and create its folder."""
+
+    config = load_config()
+    swarii_window = config["preprocessing_parameters"]["swarii_window_size"]
+
+    return build_filename(filepath, folder_to_replace="BalanceBoard/Repro", destination_folder="results/cop_plots",
+                          name_extension="_SWARII_{}.png".format(swarii_window))
+
+
+def build_spectral_densities_filename(filepath):
+    """Build the path of the spectral densities plot of a COP data file, and create its folder."""
+
+    return build_filename(filepath, folder_to_replace="cop_data", destination_folder="spectrum_plots",
+                          name_extension="_spectrum.png")
+
+
 def plot_swarii_comparison_stabilograms(preprocessed_cop_data_no_swarii, preprocessed_cop_data_swarii, device_name,
                                         acq_frequency, filepath=None):
     """"Plot and save stabilograms from COP data."""